@@ -2,15 +2,32 @@
 from dotenv import load_dotenv
 load_dotenv()
 import os
-from fastapi import FastAPI, Request, UploadFile, File
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
-from code.answer_with_provenance import answer_question  # our upgraded function
-from pathlib import Path
+from code.answer_with_provenance import answer_question_async, answer_question_stream_async  # our upgraded function
+from code.batch_answer import answer_batch
+from code.concurrency import AdmissionController, Overloaded, shutdown_executors, run_in_retrieval_pool
+from code.session_store import get_session_store
+from code.manifest import list_documents
+from code.precompute import log_question
+from code.jobs import JobQueue, sanitize_filename, UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES
+from code import tracing
+from code import models
+import asyncio
+import json
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
+# Load models + warm up in the background at startup (set WARMUP_ON_STARTUP=0 to skip)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))   # largest /chat/batch request accepted
+
 
 app = FastAPI()
 app.add_middleware(
@@ -24,53 +41,300 @@ app.add_middleware(
 # Serve the static frontend
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Bounded concurrency for /chat: excess requests get a 503 instead of queueing forever
+chat_admission = AdmissionController()
+
+# Uploaded documents are ingested in the background; jobs back off while chats are running
+ingest_jobs = JobQueue(busy=lambda: chat_admission.active > 0)
+
+
+async def _warmup():
+    try:
+        await run_in_retrieval_pool(models.warmup)
+        logger.info("Models warmed up in %ss", models.status()["warmup_seconds"])
+    except Exception:
+        logger.exception("Model warmup failed")
+
+
+@app.on_event("startup")
+async def startup():
+    # Don't block startup on model loading: /healthz answers immediately,
+    # /readyz flips to 200 once warmup has finished.
+    if WARMUP_ON_STARTUP:
+        app.state.warmup_task = asyncio.create_task(_warmup())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_executors()
+    ingest_jobs.shutdown()
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, candidate counts, LLM token usage."""
+    return PlainTextResponse(tracing.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are loaded and warmed up."""
+    status = models.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+def overloaded_error():
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry shortly.",
+        headers={"Retry-After": "1"},
+    )
+
 class ChatRequest(BaseModel):
     system_prompt: Optional[str] = ""
     user_prompt: str
     mode: Optional[str] = "strict"      # "strict" or "hybrid"
     show_citations: Optional[bool] = True
     session_id: Optional[str] = None
-    chat_history: Optional[List[dict]] = None  # [{question,answer},...]
+    chat_history: Optional[List[dict]] = None  # [{question,answer},...]; omit to use the server-side session
+    debug_timings: Optional[bool] = False      # include per-stage timings in the /chat response
+    doc_ids: Optional[List[str]] = None        # only search these documents
+    tags: Optional[List[str]] = None           # only search documents with any of these tags
+
+
+def session_history(req):
+    """(session_id, history): history sent by the client wins, else the stored session."""
+    sid = req.session_id or str(uuid.uuid4())
+    if req.chat_history is not None:
+        return sid, req.chat_history
+    return sid, get_session_store().get(sid) if req.session_id else []
+
+
+def log_plain_question(req, history):
+    """Standalone questions go to the question log (mined by code.precompute); follow-ups and scoped ones don't."""
+    if not history and not req.system_prompt and not req.doc_ids and not req.tags:
+        log_question(req.user_prompt, req.mode)
+
+
+def record_turn(sid, req, history, answer):
+    """Blocking SQLite/file writes after an answer; callers run it off the event loop."""
+    get_session_store().append(sid, {"question": req.user_prompt, "answer": answer})
+    log_plain_question(req, history)
+
 
 @app.post("/chat")
 async def chat(req: ChatRequest):
-    # Build combined question: include system prompt as explicit instruction at top
-    # We will send system_prompt separately to answer_question so it can be integrated into LLM prompt.
-    # answer_question currently signature: answer_question(question, chat_history=None, mode="strict", show_citations=True)
-    # We'll pass system_prompt by prepending to the question for now (or update answer_question to accept it).
-    system_part = ""
-    if req.system_prompt:
-        system_part = f"SYSTEM_INSTRUCTION:\n{req.system_prompt}\n\n"
-
-    # Combine system instruction and user prompt (also pass chat_history separately)
-    combined_question = system_part + req.user_prompt
-
-    result = answer_question(combined_question, chat_history=req.chat_history or [], mode=req.mode, show_citations=req.show_citations)
-
-    # Add session id if not provided
-    if not req.session_id:
-        sid = str(uuid.uuid4())
-    else:
-        sid = req.session_id
-
-    return {
+    # The system prompt goes into the LLM prompt only; retrieval sees the user's question
+    sid, history = await asyncio.to_thread(session_history, req)
+
+    try:
+        with tracing.trace() as trace, tracing.span("chat_request"):
+            async with chat_admission.slot():
+                result = await answer_question_async(
+                    req.user_prompt, chat_history=history, mode=req.mode,
+                    show_citations=req.show_citations, system_prompt=req.system_prompt,
+                    doc_ids=req.doc_ids, tags=req.tags
+                )
+    except Overloaded:
+        raise overloaded_error()
+
+    await asyncio.to_thread(record_turn, sid, req, history, result["answer"])
+
+    response = {
         "session_id": sid,
         "answer": result["answer"],
         "confidence": result["confidence"],
         "chunks": result.get("chunks", []),
         "previews": result.get("previews", [])
     }
+    if req.debug_timings:
+        response["debug_timings"] = trace.as_dict()
+    return response
+
+
+class BatchQuestion(BaseModel):
+    id: Optional[str] = None
+    question: str
+    mode: Optional[str] = None          # overrides the batch mode for this question
+
+
+class BatchRequest(BaseModel):
+    questions: List[BatchQuestion]
+    system_prompt: Optional[str] = ""
+    mode: Optional[str] = "strict"
+    show_citations: Optional[bool] = True
+    doc_ids: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+
+
+@app.post("/chat/batch")
+async def chat_batch(req: BatchRequest):
+    """
+    Answer many independent questions in one call (bulk evaluation): retrieval
+    is batched, LLM calls run concurrently under the batch rate limit. The
+    whole batch takes one admission slot. Results come back in request order.
+    """
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+
+    items = [{"id": q.id or str(i), "question": q.question, "mode": q.mode} for i, q in enumerate(req.questions)]
+    try:
+        async with chat_admission.slot():
+            results = await answer_batch(
+                items, mode=req.mode, show_citations=req.show_citations, system_prompt=req.system_prompt,
+                doc_ids=req.doc_ids, tags=req.tags
+            )
+    except Overloaded:
+        raise overloaded_error()
+    return {"results": results}
+
+
+@app.get("/documents")
+async def documents():
+    """Indexed documents with their tags (values usable as doc_ids / tags in /chat)."""
+    return {"documents": list_documents()}
+
+
+# Plain def: FastAPI runs these in its threadpool, keeping SQLite off the event loop
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    return {"session_id": session_id, "turns": get_session_store().get(session_id)}
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    get_session_store().delete(session_id)
+    return {"status": "ok"}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that gives its admission slot back once sending ends,
+    however it ends. The body generator's own finally is not enough: a client
+    that disconnects before the first chunk cancels the response before the
+    generator ever starts, and a never-started generator never runs its finally.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent-Events version of /chat. Emits:
+      event: meta   -> session_id, confidence, chunks, previews (right after retrieval)
+      event: token  -> {"text": ...} as the model generates
+      event: done   -> final answer + confidence
+    """
+    sid, history = await asyncio.to_thread(session_history, req)
+
+    # Admit before the response starts so overload is still a proper 503
+    try:
+        await chat_admission.acquire()
+    except Overloaded:
+        raise overloaded_error()
+
+    released = False
+
+    def release_slot():
+        # Idempotent: called by the generator and again by the response
+        nonlocal released
+        if not released:
+            released = True
+            chat_admission.release()
+
+    async def events():
+        try:
+            async for event, data in answer_question_stream_async(
+                req.user_prompt, chat_history=history, mode=req.mode,
+                show_citations=req.show_citations, system_prompt=req.system_prompt,
+                doc_ids=req.doc_ids, tags=req.tags
+            ):
+                if event == "meta":
+                    data = {"session_id": sid, **data}
+                elif event == "done":
+                    await asyncio.to_thread(record_turn, sid, req, history, data["answer"])
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            release_slot()
+
+    return AdmittedStreamingResponse(
+        events(),
+        release_slot,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    # Simple upload endpoint: backend should write file to data/ then call ingest/embed/index pipeline.
-    dest = Path("data") / file.filename
-    contents = await file.read()
-    dest.write_bytes(contents)
-
-    # Optionally call your ingest/embed/index scripts programmatically here.
-    # For now return success and let the user run embed/index steps in terminal or we can trigger them.
-    return {"status": "ok", "filename": str(dest)}
+async def upload(request: Request, file: UploadFile = File(...), tags: Optional[str] = Form(None)):
+    """
+    Save an uploaded text document under data/ and queue its ingestion
+    (chunk -> embed -> index). Returns the job id; poll /jobs/{id} for progress.
+    tags: optional comma-separated labels for scoped search.
+    """
+    try:
+        name = sanitize_filename(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES + 64 * 1024:   # + multipart overhead
+        raise HTTPException(status_code=413, detail=f"File larger than {UPLOAD_MAX_BYTES} bytes.")
+
+    # Copy in chunks to a temp file; only a complete upload replaces the document
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    dest = UPLOAD_DIR / name
+    tmp = UPLOAD_DIR / f".{name}.{uuid.uuid4().hex[:8]}.part"
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File larger than {UPLOAD_MAX_BYTES} bytes.")
+                await asyncio.to_thread(out.write, chunk)
+        os.replace(tmp, dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+    tag_list = [t.strip() for t in tags.split(",") if t.strip()] if tags else None
+    job = ingest_jobs.submit(dest, tag_list)
+    return {"status": "queued", "filename": str(dest), "bytes": size, "job_id": job.id}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    return job.as_dict()
+
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": [job.as_dict() for job in ingest_jobs.all()]}
+
 
 @app.get("/")
 async def root():
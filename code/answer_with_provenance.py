@@ -1,30 +1,81 @@
 # file: answer_with_provenance.py
 from textwrap import dedent
-from code.retriever_chroma import retrieve_chunks
-from groq import Groq
+from code.retriever_chroma import retrieve_chunks, embed_queries, build_where
+from code.concurrency import run_in_retrieval_pool
+from code.cache import SemanticAnswerCache
+from code.index_version import get_index_version
+from code.precompute import lookup_precomputed
+from code.models import get_llm_client, get_async_llm_client
+from code.llm_gateway import LLM_MODEL
+from code.context_packer import pack_context
+from code.tracing import span, traced, observe_stage, record_llm_usage, ANSWER_OUTCOMES
+import hashlib
+import math
 import os
+import re
+import time
 
-# Load Groq client from env
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# LLM gateways (sync for CLI, async for the API server) are created lazily from env in code/models.py
 
 # CONFIG: thresholds and defaults
-CONFIDENCE_HEURISTIC_BASE = 0.4   # base confidence when at least one chunk found
+CONFIDENCE_HEURISTIC_BASE = 0.4   # base confidence when chunks have no reranker score
 CONFIDENCE_PER_CHUNK = 0.15       # add per supporting chunk (capped)
 MAX_CONFIDENCE = 0.95
 
+# CONFIG: relevance gates on sigmoid(reranker score), 0..1 (override via env; 0 disables a gate)
+CHUNK_SCORE_FLOOR = float(os.getenv("CHUNK_SCORE_FLOOR", "0.01"))         # drop chunks below this before prompting
+STRICT_MIN_TOP_SCORE = float(os.getenv("STRICT_MIN_TOP_SCORE", "0.05"))   # strict: canned answer, no LLM call, below this
+
+# CONFIG: semantic answer cache (override via env; size 0 disables it)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_SIM_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIM_THRESHOLD", "0.95"))
+
+answer_cache = SemanticAnswerCache(
+    max_size=ANSWER_CACHE_SIZE, ttl_s=ANSWER_CACHE_TTL_S, threshold=ANSWER_CACHE_SIM_THRESHOLD
+)
+
+def relevance(chunk):
+    """Reranker logit -> 0..1 relevance (None if the chunk has no score)."""
+    score = chunk.get("score")
+    if score is None:
+        return None
+    return 1.0 / (1.0 + math.exp(-max(min(score, 50.0), -50.0)))
+
 def compute_confidence(retrieved_chunks):
     """
-    Heuristic confidence:
+    Confidence from reranker relevance:
     - If zero chunks -> 0.0
-    - else -> base + per_chunk * n (capped)
-    NOTE: replace this with real scoring when retriever returns scores.
+    - else -> 0.6 * top relevance + 0.4 * mean relevance of the top 3 (capped)
+    Falls back to base + per_chunk * n for chunks without scores.
     """
     if not retrieved_chunks:
         return 0.0
-    n = len(retrieved_chunks)
-    conf = CONFIDENCE_HEURISTIC_BASE + CONFIDENCE_PER_CHUNK * min(n, 4)
+    scores = [relevance(c) for c in retrieved_chunks]
+    if any(s is None for s in scores):
+        n = len(retrieved_chunks)
+        conf = CONFIDENCE_HEURISTIC_BASE + CONFIDENCE_PER_CHUNK * min(n, 4)
+        return min(conf, MAX_CONFIDENCE)
+    scores.sort(reverse=True)
+    conf = 0.6 * scores[0] + 0.4 * sum(scores[:3]) / len(scores[:3])
     return min(conf, MAX_CONFIDENCE)
 
+def gate_retrieved(retrieved_chunks, mode):
+    """
+    Apply the relevance gates before any prompt is built.
+    Returns (kept_chunks, answerable). answerable is False when strict mode
+    has nothing good enough to answer from, so the LLM call can be skipped.
+    """
+    scored = [(c, relevance(c)) for c in retrieved_chunks]
+    kept = [c for c, rel in scored if rel is None or rel >= CHUNK_SCORE_FLOOR]
+    if mode != "strict":
+        return kept, True
+    top = max((rel for c, rel in scored if rel is not None and c in kept), default=None)
+    answerable = bool(kept) and (top is None or top >= STRICT_MIN_TOP_SCORE)
+    if not answerable:
+        ANSWER_OUTCOMES.inc(outcome="no_info")
+    return kept, answerable
+
 def build_prompt_strict(question, retrieved_chunks, chat_history_text=""):
     """
     Strict prompt: must only use provided chunks and cite them.
@@ -99,72 +150,166 @@ def format_chunk_preview(retrieved_chunks, max_chars=300):
     return previews
 
 
-def answer_question(question, chat_history=None, mode='strict', show_citations=True, system_prompt=None):   
-    """
-    Main RAG answering function.
+NO_INFO_ANSWER = "I don’t have information about this in the document."
 
-    - question: string (could include recent chat history text)
-    - chat_history: list of {question, answer} dicts (optional)
-    - mode: "strict" or "hybrid"
-    - show_citations: True/False - whether to include citations in returned text
 
-    Returns:
-      dict {
-        "answer": str,
-        "confidence": float (0.0-1.0),
-        "chunks": [retrieved chunk dicts],
-        "previews": [ (idx, source, preview_text) ]
-      }
-    """
+def get_model_name():
+    # LLM_MODEL (or the older GROQ_MODEL) env var, e.g. 'llama-3.1-8b-instant'
+    return LLM_MODEL
+
+
+# ───────────────────────────────────────────────
+# Conversation context: summarized history + compact retrieval query
+# ───────────────────────────────────────────────
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "2"))      # newest turns kept verbatim
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "8"))            # older ones (up to this) are summarized
+HISTORY_SUMMARY_WORDS = 25                                              # words kept per summarized answer
+QUERY_CONTEXT_TERMS = int(os.getenv("QUERY_CONTEXT_TERMS", "6"))        # terms borrowed from the last question
+
+FOLLOW_UP_RE = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|one|ones|same|above|previous|else|more|also)\b", re.I
+)
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or the this that to what when where "
+    "which who why with you your my me we our was were will would should could about into than then there".split()
+)
+
 
-    # Build chat history text for context (if provided)
+def _first_words(text, n):
+    words = text.split()
+    return " ".join(words[:n]) + (" ..." if len(words) > n else "")
+
+
+def build_chat_history_text(chat_history):
+    """
+    Prompt history: the newest HISTORY_RECENT_TURNS turns verbatim, older
+    ones (up to HISTORY_MAX_TURNS) as one-line extractive summaries.
+    The token cap is applied later by pack_context().
+    """
     chat_history_text = ""
-    if chat_history:
-        for turn in chat_history[-4:]:
-            chat_history_text += f"User: {turn['question']}\nBot: {turn['answer']}\n\n"
+    if not chat_history:
+        return chat_history_text
+    turns = chat_history[-HISTORY_MAX_TURNS:]
+    split = max(len(turns) - HISTORY_RECENT_TURNS, 0)
+    older, recent = turns[:split], turns[split:]
+    if older:
+        chat_history_text += "Earlier in this conversation:\n"
+        for turn in older:
+            chat_history_text += f"- {turn['question']} -> {_first_words(turn['answer'], HISTORY_SUMMARY_WORDS)}\n"
+        chat_history_text += "\n"
+    for turn in recent:
+        chat_history_text += f"User: {turn['question']}\nBot: {turn['answer']}\n\n"
+    return chat_history_text
 
-    # 1) Retrieve candidate chunks (retriever must return list of dicts with text & metadata)
-    retrieved = retrieve_chunks(question, top_k=6)  # get up to 6 for hybrid rerank/summary
 
-    # 2) Compute confidence heuristic
-    confidence = compute_confidence(retrieved)
+def standalone_query(question, chat_history):
+    """
+    Compact retrieval query for a conversational turn. Self-contained
+    questions are used as-is; short or referential follow-ups ("what about
+    its complexity?") borrow a few content terms from the previous question.
+    Only this string is embedded and reranked, never the whole history.
+    """
+    if not chat_history:
+        return question
+    words = re.findall(r"[A-Za-z0-9_']+", question)
+    if len(words) > 6 and not FOLLOW_UP_RE.search(question):
+        return question
+    present = {w.lower() for w in words}
+    borrowed = []
+    for term in re.findall(r"[A-Za-z0-9_']+", chat_history[-1]["question"]):
+        if term.lower() in STOPWORDS or term.lower() in present or len(term) < 3:
+            continue
+        present.add(term.lower())
+        borrowed.append(term)
+        if len(borrowed) >= QUERY_CONTEXT_TERMS:
+            break
+    return f"{question} {' '.join(borrowed)}" if borrowed else question
 
-    # 3) Build prompt depending on mode
+
+@traced("build_prompt")
+def build_prompt(question, retrieved, chat_history_text, mode, system_prompt=None):
     if mode == "strict":
         prompt = build_prompt_strict(question, retrieved, chat_history_text)
     else:
         prompt = build_prompt_hybrid(question, retrieved, chat_history_text)
+    if system_prompt:
+        prompt = f"SYSTEM_INSTRUCTION:\n{system_prompt}\n\n" + prompt
+    return prompt
+
+
+def retrieve_for_answer(query, doc_ids=None, tags=None):
+    """
+    Retrieval (optionally scoped to some documents / tags) plus the query
+    embedding used for the answer cache.
+    One function so the async path can run both on the retrieval executor;
+    the embedding is a query-cache hit since retrieve_chunks just encoded it.
+    """
+    with span("retrieve"):
+        retrieved = retrieve_chunks(query, top_k=6, where=build_where(doc_ids, tags))  # get up to 6 for hybrid rerank/summary
+    question_vec = embed_queries([query])[0]
+    return retrieved, question_vec
 
-    # 4) Query Groq model
-    # Use a modern supported model name — set via env or change here (example: 'llama-3.1-8b-instant')
-    model_name = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
-    response = client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "user", "content": prompt}]
-    )
 
-    # groq returns a message object
-    text = response.choices[0].message.content
+def answer_cache_key(retrieved, mode, show_citations, chat_history_text, system_prompt=None):
+    """Exact part of the answer-cache key; the question itself is matched by embedding similarity."""
+    context = f"{system_prompt}\x00{chat_history_text}" if system_prompt else chat_history_text
+    history_hash = hashlib.sha1(context.encode("utf-8")).hexdigest() if context else ""
+    return (mode, bool(show_citations), frozenset(c["id"] for c in retrieved), history_hash)
 
-    # 5) If strict and the model didn't follow instructions, do a safety-check:
+
+def lookup_cached_answer(question, question_vec, cache_key):
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    # Any re-index invalidates every cached answer
+    answer_cache.check_version(get_index_version())
+    cached = answer_cache.get(cache_key, question, question_vec)
+    if cached is not None:
+        ANSWER_OUTCOMES.inc(outcome="cache_hit")
+    return cached
+
+
+def store_cached_answer(question, question_vec, cache_key, result):
+    if ANSWER_CACHE_SIZE > 0:
+        answer_cache.put(cache_key, question, question_vec, result)
+
+
+def precomputed_answer(question, chat_history, mode, show_citations, system_prompt, doc_ids, tags):
+    """Answer built offline by code/precompute.py for a plain, unscoped question (else None); no model work."""
+    if chat_history or system_prompt or doc_ids or tags:
+        return None
+    result = lookup_precomputed(question, mode, show_citations)
+    if result is not None:
+        ANSWER_OUTCOMES.inc(outcome="precomputed")
+    return result
+
+
+def no_info_result():
+    return {
+        "answer": NO_INFO_ANSWER,
+        "confidence": 0.0,
+        "chunks": [],
+        "previews": []
+    }
+
+
+def finalize_answer(text, retrieved, confidence, mode, show_citations):
+    """
+    Post-process the raw LLM text into the response dict shared by the
+    sync and async answering paths.
+    """
+    # If strict and the model didn't follow instructions, do a safety-check:
     #    If the text contains phrases like "I don’t have information" - it's OK.
     #    Otherwise, if strict mode but model produced content that cites nothing and retrieved empty, override.
     if mode == "strict" and not retrieved:
         # Enforce strict behavior
-        return {
-            "answer": "I don’t have information about this in the document.",
-            "confidence": 0.0,
-            "chunks": [],
-            "previews": []
-        }
-
-    # 6) Build chunk previews (for UI)
+        return no_info_result()
+
+    # Build chunk previews (for UI)
     previews = format_chunk_preview(retrieved)
 
-    # 7) Optionally strip or keep citations in returned answer based on show_citations
+    # Optionally strip or keep citations in returned answer based on show_citations
     if not show_citations:
         # naive remove of bracketed chunk citations (e.g., [Chunk 0])
-        import re
         text = re.sub(r"\[Chunk\s*\d+\]", "", text)
 
     return {
@@ -173,3 +318,314 @@ def answer_question(question, chat_history=None, mode='strict', show_citations=T
         "chunks": retrieved,
         "previews": previews
     }
+
+
+class CitationStripper:
+    """
+    Removes [Chunk N] citations from a token stream. A citation can be split
+    across several tokens, so any tail that could still become one is held
+    back until it either completes (and is dropped) or can't match anymore.
+    """
+
+    _FULL = re.compile(r"\[Chunk\s*\d+\]")
+    _PARTIAL = re.compile(r"\[(C(h(u(n(k\s*\d*)?)?)?)?)?")
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer = self._FULL.sub("", self.buffer + text)
+        cut = self.buffer.rfind("[")
+        if cut != -1 and self._PARTIAL.fullmatch(self.buffer[cut:]):
+            out, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        else:
+            out, self.buffer = self.buffer, ""
+        return out
+
+    def flush(self):
+        out, self.buffer = self.buffer, ""
+        return out
+
+
+def _stream_usage(chunk):
+    """Token usage if this stream chunk carries it (OpenAI: chunk.usage, Groq: chunk.x_groq.usage)."""
+    return getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+
+
+def _meta_event(retrieved, confidence):
+    return ("meta", {
+        "confidence": round(confidence, 2),
+        "chunks": retrieved,
+        "previews": format_chunk_preview(retrieved),
+    })
+
+
+# ───────────────────────────────────────────────
+# Steps shared by all four entry points. Only the transport differs between
+# them: sync or async LLM call, whole response or token stream.
+# ───────────────────────────────────────────────
+class PreparedAnswer:
+    """
+    Outcome of prepare_answer(): either `result` is already final (no-info or
+    answer-cache hit, no LLM call needed) or `prompt` goes to the LLM and
+    finish_answer() turns the reply into the result.
+    """
+
+    def __init__(self, result=None, prompt=None, retrieved=None, confidence=0.0,
+                 query=None, question_vec=None, cache_key=None, mode='strict', show_citations=True):
+        self.result = result
+        self.prompt = prompt
+        self.retrieved = retrieved
+        self.confidence = confidence
+        self.query = query
+        self.question_vec = question_vec
+        self.cache_key = cache_key
+        self.mode = mode
+        self.show_citations = show_citations
+
+
+def prepare_answer(question, query, retrieved, question_vec, chat_history_text="",
+                   mode='strict', show_citations=True, system_prompt=None):
+    """
+    Everything between retrieval and the LLM call: relevance gate, context
+    packing, answer-cache lookup, confidence and prompt.
+    """
+    # Drop low-relevance chunks; strict mode with nothing relevant never reaches the LLM
+    retrieved, answerable = gate_retrieved(retrieved, mode)
+    if not answerable:
+        return PreparedAnswer(result=no_info_result())
+
+    # Merge overlapping neighbours and fit chunks + history into the model's token budget
+    retrieved, chat_history_text = pack_context(retrieved, chat_history_text, get_model_name())
+
+    # Same question (or a near-paraphrase) over the same chunks -> reuse the answer, skip the LLM
+    cache_key = answer_cache_key(retrieved, mode, show_citations, chat_history_text, system_prompt)
+    cached = lookup_cached_answer(query, question_vec, cache_key)
+    if cached is not None:
+        return PreparedAnswer(result=cached)
+
+    return PreparedAnswer(
+        prompt=build_prompt(question, retrieved, chat_history_text, mode, system_prompt),
+        retrieved=retrieved, confidence=compute_confidence(retrieved),
+        query=query, question_vec=question_vec, cache_key=cache_key,
+        mode=mode, show_citations=show_citations,
+    )
+
+
+def llm_request(prepared, stream=False):
+    """Keyword arguments for chat.completions.create()."""
+    request = {"model": get_model_name(), "messages": [{"role": "user", "content": prepared.prompt}]}
+    if stream:
+        request["stream"] = True
+    return request
+
+
+def finish_answer(prepared, text, usage=None):
+    """Everything after the LLM call: usage metrics, post-processing, answer cache."""
+    record_llm_usage(usage)
+    ANSWER_OUTCOMES.inc(outcome="llm")
+    result = finalize_answer(text, prepared.retrieved, prepared.confidence, prepared.mode, prepared.show_citations)
+    store_cached_answer(prepared.query, prepared.question_vec, prepared.cache_key, result)
+    return result
+
+
+def _result_events(result):
+    """Stream events for an answer that is already final (no-info, cached or precomputed)."""
+    yield ("meta", {"confidence": result["confidence"], "chunks": result["chunks"], "previews": result["previews"]})
+    yield ("token", {"text": result["answer"]})
+    yield ("done", {"answer": result["answer"], "confidence": result["confidence"]})
+
+
+class StreamAssembler:
+    """
+    Per-chunk bookkeeping for a streamed LLM reply, shared by the sync and
+    async streams: token usage, first-token timing, citation stripping and
+    the full text for finish_answer().
+    """
+
+    def __init__(self, show_citations):
+        self.start = time.perf_counter()
+        self.stripper = None if show_citations else CitationStripper()
+        self.parts = []
+        self.usage = None
+
+    def feed(self, chunk):
+        """Text to send to the client for this chunk ("" if none)."""
+        self.usage = _stream_usage(chunk) or self.usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            return ""
+        if not self.parts:
+            observe_stage("llm_first_token", time.perf_counter() - self.start)
+        self.parts.append(delta)
+        return self.stripper.feed(delta) if self.stripper else delta
+
+    def flush(self):
+        """Held-back tail once the stream has ended."""
+        observe_stage("llm", time.perf_counter() - self.start)
+        return self.stripper.flush() if self.stripper else ""
+
+    def text(self):
+        return "".join(self.parts)
+
+
+# ───────────────────────────────────────────────
+# Entry points
+# ───────────────────────────────────────────────
+def answer_question(question, chat_history=None, mode='strict', show_citations=True, system_prompt=None,
+                    doc_ids=None, tags=None):
+    """
+    Main RAG answering function.
+
+    - question: the user's question only (history goes in chat_history)
+    - chat_history: list of {question, answer} dicts (optional); older turns are summarized,
+      and only a compact standalone query is used for retrieval
+    - system_prompt: optional instruction placed at the top of the LLM prompt
+    - mode: "strict" or "hybrid"
+    - show_citations: True/False - whether to include citations in returned text
+    - doc_ids / tags: optional lists; only chunks from these documents (and with any of these tags) are searched
+
+    Returns:
+      dict {
+        "answer": str,
+        "confidence": float (0.0-1.0),
+        "chunks": [retrieved chunk dicts],
+        "previews": [ (idx, source, preview_text) ]
+      }
+    """
+    # Frequent questions answered offline: no retrieval, no LLM
+    precomputed = precomputed_answer(question, chat_history, mode, show_citations, system_prompt, doc_ids, tags)
+    if precomputed is not None:
+        return precomputed
+
+    chat_history_text = build_chat_history_text(chat_history)
+    query = standalone_query(question, chat_history)
+    retrieved, question_vec = retrieve_for_answer(query, doc_ids, tags)
+
+    prepared = prepare_answer(question, query, retrieved, question_vec, chat_history_text,
+                              mode, show_citations, system_prompt)
+    if prepared.result is not None:
+        return prepared.result
+
+    # Query the LLM (through the gateway: deadline, retries, rate limit)
+    with span("llm"):
+        response = get_llm_client().chat.completions.create(**llm_request(prepared))
+    # OpenAI-style response: choices[0].message
+    return finish_answer(prepared, response.choices[0].message.content, getattr(response, "usage", None))
+
+
+async def answer_question_async(question, chat_history=None, mode='strict', show_citations=True, system_prompt=None,
+                                doc_ids=None, tags=None):
+    """
+    Async twin of answer_question() for the API server.
+
+    Retrieval (embedding, vector search, rerank) runs on the dedicated
+    retrieval executor, and the LLM call is awaited on the async gateway,
+    so concurrent requests overlap their LLM wait time instead of
+    blocking the event loop. Same arguments and return value as answer_question().
+    """
+    # SQLite lookup (and, after a re-index, a vector-store check): keep it off the event loop
+    precomputed = await run_in_retrieval_pool(
+        precomputed_answer, question, chat_history, mode, show_citations, system_prompt, doc_ids, tags
+    )
+    if precomputed is not None:
+        return precomputed
+
+    chat_history_text = build_chat_history_text(chat_history)
+    query = standalone_query(question, chat_history)
+    retrieved, question_vec = await run_in_retrieval_pool(retrieve_for_answer, query, doc_ids, tags)
+    return await answer_retrieved_async(
+        question, query, retrieved, question_vec, chat_history_text, mode, show_citations, system_prompt
+    )
+
+
+async def answer_retrieved_async(question, query, retrieved, question_vec, chat_history_text="",
+                                 mode='strict', show_citations=True, system_prompt=None):
+    """
+    Everything in answer_question_async() after retrieval (gate, pack, cache,
+    LLM, post-processing), for callers that retrieve in bulk (batch_answer).
+    """
+    prepared = prepare_answer(question, query, retrieved, question_vec, chat_history_text,
+                              mode, show_citations, system_prompt)
+    if prepared.result is not None:
+        return prepared.result
+
+    with span("llm"):
+        response = await get_async_llm_client().chat.completions.create(**llm_request(prepared))
+    return finish_answer(prepared, response.choices[0].message.content, getattr(response, "usage", None))
+
+
+def answer_question_stream(question, chat_history=None, mode='strict', show_citations=True, system_prompt=None,
+                           doc_ids=None, tags=None):
+    """
+    Streaming variant of answer_question(). Yields (event, data) tuples:
+
+      ("meta",  {"confidence", "chunks", "previews"})   once, right after retrieval
+      ("token", {"text"})                               for every piece of model output
+      ("done",  {"answer", "confidence"})               once, with the final post-processed answer
+    """
+    precomputed = precomputed_answer(question, chat_history, mode, show_citations, system_prompt, doc_ids, tags)
+    if precomputed is not None:
+        yield from _result_events(precomputed)
+        return
+
+    chat_history_text = build_chat_history_text(chat_history)
+    query = standalone_query(question, chat_history)
+    retrieved, question_vec = retrieve_for_answer(query, doc_ids, tags)
+
+    # Strict mode with nothing relevant always ends in the canned answer, so don't stream a model reply first
+    prepared = prepare_answer(question, query, retrieved, question_vec, chat_history_text,
+                              mode, show_citations, system_prompt)
+    if prepared.result is not None:
+        yield from _result_events(prepared.result)
+        return
+
+    yield _meta_event(prepared.retrieved, prepared.confidence)
+    assembler = StreamAssembler(show_citations)
+    for chunk in get_llm_client().chat.completions.create(**llm_request(prepared, stream=True)):
+        text = assembler.feed(chunk)
+        if text:
+            yield ("token", {"text": text})
+    tail = assembler.flush()
+    if tail:
+        yield ("token", {"text": tail})
+
+    final = finish_answer(prepared, assembler.text(), assembler.usage)
+    yield ("done", {"answer": final["answer"], "confidence": final["confidence"]})
+
+
+async def answer_question_stream_async(question, chat_history=None, mode='strict', show_citations=True, system_prompt=None,
+                                       doc_ids=None, tags=None):
+    """Async twin of answer_question_stream() for the API server (same events)."""
+    precomputed = await run_in_retrieval_pool(
+        precomputed_answer, question, chat_history, mode, show_citations, system_prompt, doc_ids, tags
+    )
+    if precomputed is not None:
+        for event in _result_events(precomputed):
+            yield event
+        return
+
+    chat_history_text = build_chat_history_text(chat_history)
+    query = standalone_query(question, chat_history)
+    retrieved, question_vec = await run_in_retrieval_pool(retrieve_for_answer, query, doc_ids, tags)
+
+    prepared = prepare_answer(question, query, retrieved, question_vec, chat_history_text,
+                              mode, show_citations, system_prompt)
+    if prepared.result is not None:
+        for event in _result_events(prepared.result):
+            yield event
+        return
+
+    yield _meta_event(prepared.retrieved, prepared.confidence)
+    assembler = StreamAssembler(show_citations)
+    stream = await get_async_llm_client().chat.completions.create(**llm_request(prepared, stream=True))
+    async for chunk in stream:
+        text = assembler.feed(chunk)
+        if text:
+            yield ("token", {"text": text})
+    tail = assembler.flush()
+    if tail:
+        yield ("token", {"text": tail})
+
+    final = finish_answer(prepared, assembler.text(), assembler.usage)
+    yield ("done", {"answer": final["answer"], "confidence": final["confidence"]})
@@ -0,0 +1,187 @@
+# file: batch_answer.py
+
+import asyncio
+import json
+import os
+import time
+
+from code.retriever_chroma import retrieve_chunks_batch, embed_queries, build_where
+from code.answer_with_provenance import answer_retrieved_async
+from code.precompute import lookup_precomputed
+from code.concurrency import run_in_retrieval_pool, TokenBucket
+from code.tracing import span
+
+# CONFIG: bulk question answering (override via env or CLI flags)
+BATCH_RETRIEVAL_SIZE = int(os.getenv("BATCH_RETRIEVAL_SIZE", "64"))      # questions retrieved per encode/query/rerank pass
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))     # LLM calls in flight at once
+BATCH_LLM_RATE_PER_S = float(os.getenv("BATCH_LLM_RATE_PER_S", "5"))     # LLM calls started per second (0 = no limit)
+BATCH_LLM_BURST = int(os.getenv("BATCH_LLM_BURST", "5"))
+BATCH_TOP_K = 6                                                          # same as retrieve_for_answer()
+
+
+def retrieve_batch(questions, where=None):
+    """[(retrieved, question_vec)] for each question, using one batched pass for all of them."""
+    with span("retrieve_batch"):
+        retrieved = retrieve_chunks_batch(questions, top_k=BATCH_TOP_K, where=where)
+    # Query-cache hits: retrieve_chunks_batch just encoded these
+    return list(zip(retrieved, embed_queries(questions)))
+
+
+def _result_row(item, result):
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": result["answer"],
+        "confidence": result["confidence"],
+        "chunk_ids": [c["id"] for c in result.get("chunks", [])],
+        "previews": result.get("previews", []),
+    }
+
+
+async def answer_batch(items, mode='strict', show_citations=True, system_prompt=None,
+                       concurrency=BATCH_LLM_CONCURRENCY, rate_per_s=BATCH_LLM_RATE_PER_S,
+                       burst=BATCH_LLM_BURST, batch_size=BATCH_RETRIEVAL_SIZE, on_result=None,
+                       doc_ids=None, tags=None, on_answer=None, use_precomputed=True):
+    """
+    Answer many independent questions (no chat history).
+
+    items: [{"id", "question", optional "mode"}]. Questions are retrieved
+    `batch_size` at a time with one embed call, one vector-store query and one
+    reranker call per pass; their LLM calls then run concurrently (at most
+    `concurrency` in flight, started at `rate_per_s`), overlapping with the
+    retrieval of the next pass. on_result(row) is called as each answer
+    completes (used for resumable output); returns all rows in input order.
+    on_answer(item, result) gets the full answer dict (None on error).
+    doc_ids / tags scope retrieval for the whole batch. Unscoped batches
+    without a system prompt are answered from precomputed answers where
+    possible (use_precomputed=False skips that, e.g. when refreshing them).
+    """
+    where = build_where(doc_ids, tags)
+    limiter = TokenBucket(rate_per_s, burst)
+    in_flight = asyncio.Semaphore(max(concurrency, 1))
+    rows = [None] * len(items)
+
+    async def answer_one(i, item, retrieved, question_vec):
+        async with in_flight:
+            await limiter.acquire()
+            try:
+                result = await answer_retrieved_async(
+                    item["question"], item["question"], retrieved, question_vec, "",
+                    item.get("mode") or mode, show_citations, system_prompt
+                )
+            except Exception as e:
+                # One failed question must not sink the batch; it is retried on resume
+                result = None
+                row = {"id": item["id"], "question": item["question"], "error": str(e)}
+            else:
+                row = _result_row(item, result)
+        finish(i, item, row, result)
+
+    def finish(i, item, row, result):
+        rows[i] = row
+        if on_answer is not None:
+            on_answer(item, result)
+        if on_result is not None:
+            on_result(row)
+
+    todo = list(enumerate(items))
+    if use_precomputed and where is None and not system_prompt:
+        # SQLite lookups, off the event loop
+        hits = await run_in_retrieval_pool(
+            lambda: [lookup_precomputed(item["question"], item.get("mode") or mode, show_citations) for item in items]
+        )
+        pending = []
+        for (i, item), result in zip(todo, hits):
+            if result is None:
+                pending.append((i, item))
+            else:
+                finish(i, item, _result_row(item, result), result)
+        todo = pending
+
+    tasks = []
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start:start + batch_size]
+        retrieved = await run_in_retrieval_pool(retrieve_batch, [it["question"] for _, it in chunk], where)
+        for (i, item), (docs, question_vec) in zip(chunk, retrieved):
+            tasks.append(asyncio.create_task(answer_one(i, item, docs, question_vec)))
+    await asyncio.gather(*tasks)
+    return rows
+
+
+# ───────────────────────────────────────────────
+# CLI: JSONL in, JSONL out, resumable
+# ───────────────────────────────────────────────
+def read_questions(path):
+    """One question per line: {"id", "question", optional "mode"} or a bare JSON string."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            record.setdefault("id", str(n))
+            items.append(record)
+    return items
+
+
+def completed_ids(path):
+    """IDs already answered (without error) in an existing output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue   # a line cut short by an interrupted run
+            if "error" not in row:
+                done.add(str(row["id"]))
+    return done
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions (resumable: reruns skip answered IDs).")
+    parser.add_argument("input", help="JSONL with {\"id\", \"question\"} per line")
+    parser.add_argument("output", help="JSONL results, appended to")
+    parser.add_argument("--mode", choices=["strict", "hybrid"], default="strict")
+    parser.add_argument("--no-citations", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=BATCH_LLM_RATE_PER_S, help="LLM calls per second (0 = no limit)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_RETRIEVAL_SIZE)
+    parser.add_argument("--doc", action="append", dest="doc_ids", help="only search this document (repeatable)")
+    parser.add_argument("--tag", action="append", dest="tags", help="only search documents with this tag (repeatable)")
+    args = parser.parse_args()
+
+    items = read_questions(args.input)
+    done = completed_ids(args.output)
+    todo = [it for it in items if str(it["id"]) not in done]
+    print(f"{len(items)} questions, {len(items) - len(todo)} already answered, {len(todo)} to go")
+    if not todo:
+        return
+
+    start = time.perf_counter()
+    counts = {"ok": 0, "error": 0}
+    with open(args.output, "a", encoding="utf-8") as out:
+        def write_row(row):
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()   # every finished answer survives an interruption
+            counts["error" if "error" in row else "ok"] += 1
+
+        asyncio.run(answer_batch(
+            todo, mode=args.mode, show_citations=not args.no_citations,
+            concurrency=args.concurrency, rate_per_s=args.rate,
+            batch_size=args.batch_size, on_result=write_row, doc_ids=args.doc_ids, tags=args.tags,
+        ))
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {counts['ok']} answered, {counts['error']} failed in {elapsed:.1f}s → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
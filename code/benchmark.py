@@ -0,0 +1,396 @@
+# file: benchmark.py
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Offline benchmark: synthetic corpus -> ingestion throughput -> retrieval
+# latency per stage -> end-to-end /chat throughput against fake_llm_server.py.
+# Everything runs locally (models must already be in the local HF cache and
+# tiktoken's encoding in TIKTOKEN_CACHE_DIR), so it can gate changes in CI.
+
+# Metrics compared against a baseline: (dotted path, which direction is better)
+TRACKED_METRICS = [
+    ("ingest.chunks_per_s", "higher"),
+    ("ingest.tokens_per_s", "higher"),
+    ("retrieval.total.p50_ms", "lower"),
+    ("retrieval.total.p95_ms", "lower"),
+    ("retrieval.total.p99_ms", "lower"),
+    ("chat.requests_per_s", "higher"),
+    ("chat.latency.p50_ms", "lower"),
+    ("chat.latency.p95_ms", "lower"),
+]
+
+
+# ───────────────────────────────────────────────
+# Synthetic corpus (same layout as data/hackerrank_doc.txt)
+# ───────────────────────────────────────────────
+SECTIONS = ["BASIC PROGRAMMING", "DATA STRUCTURES", "ALGORITHMS", "DYNAMIC PROGRAMMING", "GRAPHS",
+            "STRINGS", "MATHEMATICS", "SYSTEM DESIGN", "DATABASES", "INTERVIEW PREPARATION"]
+NOUNS = ["array", "linked list", "stack", "queue", "hash map", "binary tree", "heap", "graph", "trie",
+         "segment tree", "pointer", "recursion", "memoization", "sliding window", "two pointers",
+         "bit mask", "prefix sum", "greedy choice", "backtracking", "topological order", "index",
+         "transaction", "cache", "load balancer", "string", "matrix", "interval", "modulus"]
+VERBS = ["stores", "updates", "traverses", "partitions", "merges", "compares", "reduces", "caches",
+         "validates", "balances", "sorts", "counts", "searches", "splits"]
+QUALIFIERS = ["in O(1) time", "in O(log n) time", "in linear time", "with constant extra memory",
+              "for each query", "before the main loop", "without recursion", "in a single pass",
+              "on every insertion", "when the input is sorted", "under tight memory limits"]
+
+
+def _sentence(rng):
+    return (f"A {rng.choice(NOUNS)} {rng.choice(VERBS)} the {rng.choice(NOUNS)} "
+            f"{rng.choice(QUALIFIERS)}, so the {rng.choice(NOUNS)} {rng.choice(VERBS)} {rng.choice(QUALIFIERS)}.")
+
+
+def generate_corpus(path, n_paragraphs=1000, seed=0, sentences_per_paragraph=(2, 12)):
+    """
+    Write a HackerRank-style study document: numbered SECTION headings,
+    topic titles, prose paragraphs and short bullet lists, separated by
+    blank lines. Returns the topic titles (used to build questions).
+    """
+    rng = random.Random(seed)
+    titles = []
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        section = 0
+        while written < n_paragraphs:
+            section += 1
+            f.write(f"SECTION {section} — {SECTIONS[(section - 1) % len(SECTIONS)]}\n")
+            for _ in range(rng.randint(3, 8)):
+                title = f"{rng.choice(NOUNS).title()} {rng.choice(['Basics', 'Patterns', 'Problems', 'Techniques', 'Pitfalls'])} {written}"
+                titles.append(title)
+                f.write(f"{title}\n\n")
+                n_sentences = rng.randint(*sentences_per_paragraph)
+                f.write(" ".join(_sentence(rng) for _ in range(n_sentences)) + "\n\n")
+                if rng.random() < 0.3:
+                    f.write("Applications:\n\n")
+                    for _ in range(rng.randint(2, 4)):
+                        f.write(f"{rng.choice(NOUNS).capitalize()} {rng.choice(VERBS)}\n\n")
+                written += 1
+                if written >= n_paragraphs:
+                    break
+    return titles
+
+
+def make_questions(titles, n, seed=0):
+    rng = random.Random(seed + 1)
+    templates = ["What is {}?", "How do I use {}?", "Explain {} with an example",
+                 "What is the time complexity of {}?", "When should I avoid {}?"]
+    return [rng.choice(templates).format(rng.choice(titles).rsplit(" ", 1)[0].lower()) for _ in range(n)]
+
+
+# ───────────────────────────────────────────────
+# Helpers
+# ───────────────────────────────────────────────
+def percentiles(values_ms):
+    if not values_ms:
+        return {}
+    arr = np.asarray(values_ms, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def configure_workspace(workdir):
+    """Point every on-disk store at `workdir` (must run before code.* modules are imported)."""
+    workdir = Path(workdir)
+    store = workdir / "store"
+    # Always inside workdir, even if set in the environment: ingest deletes and rewrites the
+    # store, a production precomputed.db would answer benchmark questions without any work,
+    # and benchmark traffic must not reach the real question log
+    os.environ.update({
+        "CHROMA_PATH": str(store),
+        "MANIFEST_DIR": str(store / "manifests"),
+        "INDEX_VERSION_PATH": str(store / "index_version"),
+        "BM25_PATH": str(store / "bm25.json"),
+        "NUMPY_STORE_PATH": str(workdir / "numpy_store"),
+        "PRECOMPUTE_DB_PATH": str(workdir / "precomputed.db"),
+        "QUESTION_LOG_PATH": str(workdir / "questions.jsonl"),
+    })
+    defaults = {
+        "SESSION_BACKEND": "memory",
+        "ANSWER_CACHE_SIZE": "0",         # every /chat request should do the full work
+        "GROQ_API_KEY": "benchmark",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    return workdir
+
+
+def wait_for(url, timeout_s, process=None):
+    import httpx
+
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} not ready after {timeout_s}s")
+
+
+def start_process(args, env=None):
+    return subprocess.Popen([sys.executable, *args], env=env or os.environ.copy())
+
+
+def stop_process(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ───────────────────────────────────────────────
+# Stages
+# ───────────────────────────────────────────────
+def bench_ingest(corpus_path):
+    from code.models import get_embedding_model
+    from code.pipeline import run_pipeline
+    from code.tracing import stage_summary
+
+    get_embedding_model().encode(["load"], convert_to_numpy=True)   # model load is not ingestion time
+    before = stage_summary()
+    stats = run_pipeline(corpus_path)
+    after = stage_summary()
+
+    stages = {}
+    for stage, s in after.items():
+        prev = before.get(stage, {"calls": 0, "total_s": 0.0})
+        if s["calls"] > prev["calls"]:
+            stages[stage] = {"calls": s["calls"] - prev["calls"], "total_s": round(s["total_s"] - prev["total_s"], 3)}
+
+    seconds = max(stats["seconds"], 1e-9)
+    return {
+        "chunks": stats["total"],
+        "embedded": stats["embedded"],
+        "tokens": stats["tokens"],
+        "seconds": stats["seconds"],
+        "chunks_per_s": round(stats["total"] / seconds, 2),
+        "tokens_per_s": round(stats["tokens"] / seconds, 2),
+        "stages": stages,
+    }
+
+
+def bench_retrieval(questions, cold_cache=True):
+    from code import models
+    from code.retriever_chroma import retrieve_chunks, query_embedding_cache
+    from code.tracing import trace
+
+    models.warmup()
+    retrieve_chunks(questions[0], top_k=6)   # first query pays one-off index/page-cache costs
+    totals, stages, counts = [], {}, {}
+    for question in questions:
+        if cold_cache:
+            query_embedding_cache.clear()
+        with trace() as t:
+            retrieve_chunks(question, top_k=6)
+        result = t.as_dict()
+        totals.append(result["total_ms"])
+        for stage, ms in result["stages_ms"].items():
+            stages.setdefault(stage, []).append(ms)
+        for name, n in result["counts"].items():
+            counts.setdefault(name, []).append(n)
+
+    return {
+        "queries": len(questions),
+        "cold_cache": cold_cache,
+        "total": percentiles(totals),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "mean_counts": {name: round(float(np.mean(values)), 2) for name, values in sorted(counts.items())},
+    }
+
+
+async def _drive_chat(base_url, questions, clients, n_requests, mode):
+    import httpx
+
+    latencies, statuses = [], {}
+    next_index = 0
+
+    async def client_loop(client):
+        nonlocal next_index
+        while next_index < n_requests:
+            i = next_index
+            next_index += 1
+            payload = {"user_prompt": questions[i % len(questions)], "mode": mode}
+            start = time.perf_counter()
+            try:
+                r = await client.post(f"{base_url}/chat", json=payload)
+                status = r.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+        seconds = time.perf_counter() - start
+    return latencies, statuses, seconds
+
+
+def bench_chat(questions, clients, n_requests, mode, port, llm_port, llm_latency_ms, llm_tokens_per_s,
+               completion_tokens, ready_timeout_s=600):
+    """Starts fake_llm_server and the API (uvicorn) as subprocesses and drives /chat with N clients."""
+    llm = start_process(["-m", "code.fake_llm_server", "--port", str(llm_port),
+                         "--latency-ms", str(llm_latency_ms), "--tokens-per-s", str(llm_tokens_per_s),
+                         "--completion-tokens", str(completion_tokens)])
+    env = dict(os.environ, LLM_BASE_URL=f"http://127.0.0.1:{llm_port}/v1", WARMUP_ON_STARTUP="1")
+    api = start_process(["-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"], env=env)
+    try:
+        wait_for(f"http://127.0.0.1:{llm_port}/healthz", 60, llm)
+        wait_for(f"http://127.0.0.1:{port}/readyz", ready_timeout_s, api)
+        latencies, statuses, seconds = asyncio.run(
+            _drive_chat(f"http://127.0.0.1:{port}", questions, clients, n_requests, mode)
+        )
+    finally:
+        stop_process(api)
+        stop_process(llm)
+
+    ok = statuses.get(200, 0)
+    return {
+        "clients": clients,
+        "requests": n_requests,
+        "mode": mode,
+        "llm": {"latency_ms": llm_latency_ms, "tokens_per_s": llm_tokens_per_s, "completion_tokens": completion_tokens},
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "seconds": round(seconds, 3),
+        "requests_per_s": round(ok / seconds, 3) if seconds > 0 else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+
+# ───────────────────────────────────────────────
+# Baseline comparison
+# ───────────────────────────────────────────────
+def _lookup(results, dotted):
+    value = results
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_to_baseline(results, baseline, threshold=0.10):
+    """
+    Compare tracked metrics (plus each retrieval stage's p95). A metric
+    regresses when it is worse than the baseline by more than `threshold`
+    (relative). Returns a list of {metric, baseline, current, change, regressed}.
+    """
+    tracked = list(TRACKED_METRICS)
+    for stage in sorted((_lookup(baseline, "retrieval.stages") or {}).keys()):
+        tracked.append((f"retrieval.stages.{stage}.p95_ms", "lower"))
+
+    rows = []
+    for metric, better in tracked:
+        old, new = _lookup(baseline, metric), _lookup(results, metric)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old == 0:
+            continue
+        change = (new - old) / old
+        regressed = change > threshold if better == "lower" else change < -threshold
+        rows.append({"metric": metric, "baseline": old, "current": new,
+                     "change": round(change, 4), "regressed": regressed})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline performance benchmark for the RAG pipeline.")
+    parser.add_argument("--workdir", help="scratch directory for the corpus and index (default: temp dir)")
+    parser.add_argument("--corpus", help="use this document instead of generating one")
+    parser.add_argument("--paragraphs", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=100, help="retrieval benchmark queries")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the query-embedding cache between queries")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent /chat clients")
+    parser.add_argument("--requests", type=int, default=100, help="total /chat requests")
+    parser.add_argument("--mode", default="strict", choices=["strict", "hybrid"])
+    parser.add_argument("--port", type=int, default=8765, help="port for the API under test")
+    parser.add_argument("--llm-port", type=int, default=8766, help="port for the fake LLM server")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=250)
+    parser.add_argument("--completion-tokens", type=int, default=80)
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--skip-retrieval", action="store_true")
+    parser.add_argument("--skip-chat", action="store_true")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    workdir = configure_workspace(args.workdir or tempfile.mkdtemp(prefix="rag-bench-"))
+    corpus = Path(args.corpus) if args.corpus else workdir / "synthetic_doc.txt"
+    if args.corpus:
+        titles = [line.strip() for line in corpus.read_text(encoding="utf-8").splitlines()
+                  if line.strip() and len(line.split()) <= 6]
+    else:
+        titles = generate_corpus(corpus, args.paragraphs, args.seed)
+    questions = make_questions(titles, max(args.queries, args.requests), args.seed)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workdir": str(workdir),
+            "corpus": str(corpus),
+            "config": {k: os.getenv(k) for k in ("VECTOR_BACKEND", "INFERENCE_BACKEND", "INFERENCE_THREADS",
+                                                 "EMBEDDING_MODEL", "RERANKER_MODEL", "HYBRID_SEARCH")},
+            "args": vars(args),
+        }
+    }
+
+    if not args.skip_ingest:
+        results["ingest"] = bench_ingest(corpus)
+        print(f"ingest: {results['ingest']['chunks']} chunks, {results['ingest']['tokens_per_s']} tokens/s")
+    if not args.skip_retrieval:
+        results["retrieval"] = bench_retrieval(questions[:args.queries], cold_cache=not args.warm_cache)
+        print(f"retrieval: {results['retrieval']['total']}")
+    if not args.skip_chat:
+        results["chat"] = bench_chat(questions[:args.requests], args.clients, args.requests, args.mode,
+                                     args.port, args.llm_port, args.llm_latency_ms, args.llm_tokens_per_s,
+                                     args.completion_tokens)
+        print(f"chat: {results['chat']['requests_per_s']} req/s, latency {results['chat']['latency']}")
+
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        rows = compare_to_baseline(results, baseline, args.threshold)
+        results["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "metrics": rows}
+        for row in rows:
+            flag = "REGRESSION" if row["regressed"] else "ok"
+            print(f"{flag:>10}  {row['metric']:<40} {row['baseline']:>12} -> {row['current']:>12} ({row['change']:+.1%})")
+        if any(row["regressed"] for row in rows):
+            exit_code = 1
+
+    Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Results written to {args.out}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
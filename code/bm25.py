@@ -0,0 +1,257 @@
+# file: bm25.py
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:   # not POSIX: saves are not serialized across processes
+    fcntl = None
+
+# Lexical index stored next to the vector store; rebuilt from it if missing
+BM25_PATH = Path(os.getenv("BM25_PATH", "chroma_db/bm25.json"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text):
+    """Lowercased word/number/identifier tokens (keeps snake_case and error names intact)."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring.
+
+    forward:  chunk_id -> {term: tf}   (persisted; lets us remove/replace a chunk)
+    postings: term -> set(chunk_id)    (rebuilt on load)
+    pending:  chunk_id -> {term: tf} or None (removed), changed since the
+              last load/save; replayed onto a copy another process saved meanwhile
+    """
+
+    def __init__(self):
+        self.forward = {}
+        self.postings = {}
+        self.doc_len = {}
+        self.total_len = 0
+        self.pending = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.forward)
+
+    def _set(self, chunk_id, tf):
+        self._drop(chunk_id)
+        self.forward[chunk_id] = tf
+        length = sum(tf.values())
+        self.doc_len[chunk_id] = length
+        self.total_len += length
+        for term in tf:
+            self.postings.setdefault(term, set()).add(chunk_id)
+
+    def _drop(self, chunk_id):
+        tf = self.forward.pop(chunk_id, None)
+        if tf is None:
+            return
+        self.total_len -= self.doc_len.pop(chunk_id, 0)
+        for term in tf:
+            ids = self.postings.get(term)
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del self.postings[term]
+
+    def replay(self, pending):
+        """Apply another instance's uncommitted changes on top of this one (they stay pending here)."""
+        with self._lock:
+            for chunk_id, tf in pending.items():
+                if tf is None:
+                    self._drop(chunk_id)
+                else:
+                    self._set(chunk_id, tf)
+                self.pending[chunk_id] = tf
+
+    def add(self, chunk_id, text):
+        with self._lock:
+            tf = dict(Counter(tokenize(text)))
+            self._set(chunk_id, tf)
+            self.pending[chunk_id] = tf
+
+    def add_many(self, ids, texts):
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                self.add(chunk_id, text)
+
+    def remove(self, chunk_id):
+        with self._lock:
+            self._drop(chunk_id)
+            # Recorded even if unknown here: another process may have added it meanwhile
+            self.pending[chunk_id] = None
+
+    def remove_many(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                self.remove(chunk_id)
+
+    def search(self, query, k=10, allowed=None):
+        """Top-k (chunk_id, score) for a free-text query, best first; only IDs in `allowed` if given."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.forward)
+            if not n_docs or not terms:
+                return []
+            avg_len = self.total_len / n_docs
+            scores = {}
+            for term in terms:
+                ids = self.postings.get(term)
+                if not ids:
+                    continue
+                idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+                for chunk_id in ids if allowed is None else ids & allowed:
+                    tf = self.forward[chunk_id][term]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[chunk_id] / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+    def save(self, path=BM25_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with self._lock:
+            tmp.write_text(json.dumps({"forward": self.forward}), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=BM25_PATH):
+        index = cls()
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        for chunk_id, tf in data["forward"].items():
+            index._set(chunk_id, tf)
+        return index
+
+
+# ───────────────────────────────────────────────
+# Process-wide instance. When another process (CLI, ingest job, inference
+# server) rewrites the file, it is reloaded and this process's uncommitted
+# changes are replayed on top, so neither side's writes are lost.
+# ───────────────────────────────────────────────
+_state = {"index": None, "generation": None}
+_state_lock = threading.Lock()
+_GENERATION_PATH = BM25_PATH.with_suffix(".generation")
+
+
+def _file_generation():
+    """Save counter of BM25_PATH (None: no file yet). mtimes can't tell quick successive saves apart."""
+    try:
+        return int(_GENERATION_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return 0 if BM25_PATH.exists() else None   # saved before the counter existed
+    except ValueError:
+        return -1   # unreadable: differs from any real counter, so the file is reloaded
+
+
+def _save_locked(index):
+    """Caller holds _file_lock: write the index, then bump the counter other processes compare."""
+    index.save(BM25_PATH)
+    generation = max(_file_generation() or 0, 0) + 1
+    tmp = _GENERATION_PATH.with_suffix(".generation.tmp")
+    tmp.write_text(str(generation), encoding="utf-8")
+    os.replace(tmp, _GENERATION_PATH)
+    return generation
+
+
+@contextmanager
+def _file_lock():
+    """Serializes read-merge-write of BM25_PATH between processes."""
+    if fcntl is None:
+        yield
+        return
+    BM25_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(BM25_PATH.with_suffix(".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _reload_merged(generation):
+    """Caller holds _state_lock: load the file and replay our pending changes onto it."""
+    fresh = BM25Index.load(BM25_PATH)
+    old = _state["index"]
+    if old is not None:
+        with old._lock:
+            fresh.replay(old.pending)
+    _state["index"] = fresh
+    _state["generation"] = generation
+
+
+def _build_from_store(page_size=1000):
+    """Bootstrap the lexical index from whatever is already in the vector store."""
+    from code.models import get_vector_store
+
+    index = BM25Index()
+    store = get_vector_store()
+    offset = 0
+    while True:
+        page = store.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        index.add_many(page["ids"], page["documents"])
+        offset += len(page["ids"])
+    return index
+
+
+def get_bm25_index():
+    with _state_lock:
+        generation = _file_generation()
+        if generation is not None and (_state["index"] is None or generation != _state["generation"]):
+            _reload_merged(generation)
+        elif _state["index"] is None:
+            index = _build_from_store()
+            index.pending.clear()   # mirrors the store, nothing to commit
+            if len(index):
+                with _file_lock():
+                    generation = _save_locked(index)
+            _state["index"] = index
+            _state["generation"] = generation
+        return _state["index"]
+
+
+def save_bm25_index():
+    """
+    Persist the in-process index after writes (called by index_chroma). If
+    another process saved since we loaded, its version is reloaded and our
+    pending changes are replayed first, so its writes are kept too.
+    Rewrites the whole forward index as JSON: O(corpus) per commit.
+    """
+    with _state_lock, _file_lock():
+        if _state["index"] is None:
+            return
+        generation = _file_generation()
+        if generation is not None and generation != _state["generation"]:
+            _reload_merged(generation)
+        index = _state["index"]
+        with index._lock:
+            _state["generation"] = _save_locked(index)
+            index.pending.clear()
+
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+    Fuse several ranked lists of IDs: score(id) = sum 1 / (k + rank).
+    Returns IDs ordered by fused score.
+    """
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,154 @@
+# file: cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text):
+    """Cache key normalization: lowercase and collapse whitespace."""
+    return " ".join(text.lower().split())
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+    Used for query embeddings (key: normalized query text).
+    """
+
+    def __init__(self, max_size=4096, ttl_s=3600):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._data = OrderedDict()   # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl_s:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache for the RAG pipeline.
+
+    An entry matches when the exact part of the key (mode, citations flag,
+    retrieved chunk ID set, history) is equal AND the cosine similarity of
+    the question embeddings is above `threshold`. Entries are evicted
+    LRU-first beyond `max_size`, expire after `ttl_s`, and the whole cache
+    is dropped when the index version changes.
+    """
+
+    def __init__(self, max_size=1024, ttl_s=3600, threshold=0.95):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.index_version = None
+        self._buckets = {}           # exact_key -> OrderedDict(norm_question -> (stored_at, unit_vec, value))
+        self._lru = OrderedDict()    # (exact_key, norm_question) -> None, oldest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vec):
+        vec = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def check_version(self, index_version):
+        """Drop everything if the underlying index changed since entries were stored."""
+        with self._lock:
+            if index_version != self.index_version:
+                self._buckets.clear()
+                self._lru.clear()
+                self.index_version = index_version
+
+    def _remove(self, exact_key, norm_question):
+        bucket = self._buckets.get(exact_key)
+        if bucket is not None:
+            bucket.pop(norm_question, None)
+            if not bucket:
+                del self._buckets[exact_key]
+        self._lru.pop((exact_key, norm_question), None)
+
+    def get(self, exact_key, question, question_vec):
+        norm_question = normalize_text(question)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(exact_key)
+            if not bucket:
+                self.misses += 1
+                return None
+
+            # Drop expired entries of this bucket
+            for q in [q for q, (ts, _, _) in bucket.items() if now - ts > self.ttl_s]:
+                self._remove(exact_key, q)
+            bucket = self._buckets.get(exact_key)
+            if not bucket:
+                self.misses += 1
+                return None
+
+            if norm_question in bucket:
+                best = norm_question
+            else:
+                keys = list(bucket.keys())
+                mat = np.stack([bucket[q][1] for q in keys])
+                sims = mat @ self._unit(question_vec)
+                i = int(np.argmax(sims))
+                if sims[i] < self.threshold:
+                    self.misses += 1
+                    return None
+                best = keys[i]
+
+            self._lru.move_to_end((exact_key, best))
+            self.hits += 1
+            return bucket[best][2]
+
+    def put(self, exact_key, question, question_vec, value):
+        norm_question = normalize_text(question)
+        with self._lock:
+            bucket = self._buckets.setdefault(exact_key, OrderedDict())
+            bucket[norm_question] = (time.monotonic(), self._unit(question_vec), value)
+            self._lru[(exact_key, norm_question)] = None
+            self._lru.move_to_end((exact_key, norm_question))
+            while len(self._lru) > self.max_size:
+                (old_key, old_q), _ = self._lru.popitem(last=False)
+                self._remove(old_key, old_q)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._lru.clear()
+
+    def __len__(self):
+        return len(self._lru)
@@ -1,32 +1,32 @@
 # file: chatbot.py
 
-import time
 import sys
-from code.answer_with_provenance import answer_question
+from code.answer_with_provenance import answer_question_stream
 
 # settings and state
 conversation_history = []
 MODE = "strict"        # or "hybrid"
 SHOW_CITATIONS = True
 SHOW_PREVIEWS = False  # show chunk previews under the answer
-TYPING_DELAY = 0.02    # per-char typing delay for simulation
-
-MAX_CONTEXT_TURNS = 4
-
-def build_conversational_question(user_input):
-    recent = conversation_history[-MAX_CONTEXT_TURNS:]
-    history_text = ""
-    for turn in recent:
-        history_text += f"User: {turn['question']}\nBot: {turn['answer']}\n\n"
-    return history_text + f"User: {user_input}\n"
-
-def simulate_typing(text):
-    """Simple console typing animation (ChatGPT style)."""
-    for ch in text:
-        sys.stdout.write(ch)
-        sys.stdout.flush()
-        time.sleep(TYPING_DELAY)
+
+def stream_tokens(events):
+    """
+    Print model tokens as they arrive (ChatGPT style).
+    Returns (final_answer, confidence, previews) once the stream is done.
+    """
+    answer_text, confidence, previews = "", 0.0, []
+    for event, data in events:
+        if event == "meta":
+            confidence = data["confidence"]
+            previews = data.get("previews", [])
+        elif event == "token":
+            sys.stdout.write(data["text"])
+            sys.stdout.flush()
+        elif event == "done":
+            answer_text = data["answer"]
+            confidence = data["confidence"]
     print()  # final newline
+    return answer_text, confidence, previews
 
 def print_chunk_previews(previews):
     print("\n--- Retrieved chunk previews ---")
@@ -79,20 +79,12 @@ def chat():
                 print("Usage: /preview on|off")
             continue
 
-        # normal Q/A
-        contextual_q = build_conversational_question(user_input)
-
-        # call pipeline
-        result = answer_question(contextual_q, chat_history=conversation_history, mode=MODE, show_citations=SHOW_CITATIONS)
-
-        # typing animation for answer
-        answer_text = result["answer"]
-        confidence = result["confidence"]
-        previews = result.get("previews", [])
-
-        # Simulate typing and then show confidence & previews
+        # normal Q/A: history is passed separately (summarized for the prompt, not embedded)
+        # call pipeline and print tokens as the model generates them
         print("\nBot: ", end="")
-        simulate_typing(answer_text)
+        answer_text, confidence, previews = stream_tokens(
+            answer_question_stream(user_input, chat_history=conversation_history, mode=MODE, show_citations=SHOW_CITATIONS)
+        )
 
         # show confidence
         print(f"\nConfidence: {confidence*100:.0f}%")
@@ -0,0 +1,136 @@
+# file: concurrency.py
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+# CONFIG: sizing for the request path (override via env)
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "2"))        # threads doing embed/search/rerank
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "16"))  # requests allowed in the pipeline at once
+MAX_QUEUED_CHATS = int(os.getenv("MAX_QUEUED_CHATS", "64"))          # requests allowed to wait for a slot
+QUEUE_TIMEOUT_S = float(os.getenv("CHAT_QUEUE_TIMEOUT_S", "10"))     # max time a request waits for a slot
+
+
+# ───────────────────────────────────────────────
+# Dedicated executor for CPU-bound retrieval work
+# ───────────────────────────────────────────────
+_retrieval_executor = None
+
+
+def get_retrieval_executor():
+    """
+    Size-limited thread pool for embedding / vector search / reranking.
+    Torch and Chroma release the GIL in their heavy parts, so a few threads
+    are enough; keeping it small stops requests fighting over CPU cores.
+    """
+    global _retrieval_executor
+    if _retrieval_executor is None:
+        _retrieval_executor = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval"
+        )
+    return _retrieval_executor
+
+
+async def run_in_retrieval_pool(fn, *args, **kwargs):
+    """
+    Run a blocking function on the retrieval executor without blocking the event loop.
+    Context variables (e.g. the request's trace) are carried over to the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_retrieval_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+def shutdown_executors():
+    global _retrieval_executor
+    if _retrieval_executor is not None:
+        _retrieval_executor.shutdown(wait=False, cancel_futures=True)
+        _retrieval_executor = None
+
+
+# ───────────────────────────────────────────────
+# Admission control (bounded concurrency + bounded queue)
+# ───────────────────────────────────────────────
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted (queue full or waited too long)."""
+
+
+class AdmissionController:
+    """
+    Lets at most `max_active` requests run at once and at most `max_queued`
+    wait for a slot. Anything beyond that is rejected immediately so the
+    caller can answer 503 instead of piling up work.
+    """
+
+    def __init__(self, max_active=MAX_CONCURRENT_CHATS, max_queued=MAX_QUEUED_CHATS, queue_timeout=QUEUE_TIMEOUT_S):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(max_active)
+
+    async def acquire(self):
+        """Wait for a slot; raises Overloaded if the queue is full or the wait times out."""
+        # Counters are updated synchronously (no await in between), so this check is race-free on the loop
+        if self.active + self.waiting >= self.max_active + self.max_queued:
+            raise Overloaded("queue full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded("timed out waiting for a slot")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {"active": self.active, "waiting": self.waiting,
+                "max_active": self.max_active, "max_queued": self.max_queued}
+
+
+# ───────────────────────────────────────────────
+# Rate limiting (token bucket, for bulk LLM calls)
+# ───────────────────────────────────────────────
+class TokenBucket:
+    """
+    Async token bucket: `rate` acquisitions per second on average, with
+    bursts of up to `burst`. rate <= 0 disables the limit.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
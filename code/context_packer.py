@@ -0,0 +1,142 @@
+# file: context_packer.py
+
+import os
+
+from code.ingest_and_chunk import get_encoder, TOKENIZER_NAME
+from code.tracing import traced
+
+# CONFIG: prompt token budget for CONTEXT + chat history, per model (override via env; 0 = per-model default)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+MODEL_CONTEXT_BUDGETS = {
+    "llama-3.1-8b-instant": 2048,
+    "llama-3.3-70b-versatile": 3072,
+}
+DEFAULT_CONTEXT_BUDGET = 2048
+HISTORY_BUDGET_SHARE = float(os.getenv("HISTORY_BUDGET_SHARE", "0.3"))   # max share of the budget for history
+CHUNK_HEADER_TOKENS = 12          # "[Chunk N] (Source: ...)" line, roughly
+MIN_OVERLAP_CHARS = 16            # shortest suffix/prefix match treated as chunk overlap
+
+
+def context_budget(model_name):
+    if CONTEXT_TOKEN_BUDGET > 0:
+        return CONTEXT_TOKEN_BUDGET
+    return MODEL_CONTEXT_BUDGETS.get(model_name, DEFAULT_CONTEXT_BUDGET)
+
+
+def count_tokens(text):
+    return len(get_encoder(TOKENIZER_NAME).encode_ordinary(text)) if text else 0
+
+
+def truncate_tokens(text, max_tokens, keep="head"):
+    enc = get_encoder(TOKENIZER_NAME)
+    toks = enc.encode_ordinary(text)
+    if len(toks) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    return enc.decode(toks[:max_tokens] if keep == "head" else toks[-max_tokens:])
+
+
+def merge_overlap(a, b):
+    """
+    Join two consecutive windows of the same paragraph, dropping the text
+    they share (the end of `a` repeated at the start of `b`).
+    """
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        pos = a.find(probe)
+        while pos != -1:
+            if b.startswith(a[pos:]):
+                return a[:pos] + b
+            pos = a.find(probe, pos + 1)
+    return a.rstrip() + " " + b.lstrip()
+
+
+def _merge_group(members):
+    """members: [(rank, chunk)] from one paragraph -> [(rank, chunk dicts of one contiguous run)]"""
+    members = sorted(members, key=lambda m: m[1]["metadata"].get("chunk_idx", 0))
+    runs = []
+    for rank, chunk in members:
+        idx = chunk["metadata"].get("chunk_idx")
+        if runs and idx is not None and idx == runs[-1][1][-1]["metadata"].get("chunk_idx", -2) + 1:
+            runs[-1][0] = min(runs[-1][0], rank)
+            runs[-1][1].append(chunk)
+        else:
+            runs.append([rank, [chunk]])
+    return runs
+
+
+def _packed_chunk(run):
+    """One prompt block from a run of adjacent chunks."""
+    if len(run) == 1:
+        return dict(run[0], ids=[run[0]["id"]])
+    text = run[0]["text"]
+    for chunk in run[1:]:
+        text = merge_overlap(text, chunk["text"])
+    first, last = run[0]["metadata"], run[-1]["metadata"]
+    source = first.get("source", "Unknown")
+    if "#" in source:
+        source = f"{source.split('#')[0]}#para{first.get('para_idx')}:chunk{first.get('chunk_idx')}-{last.get('chunk_idx')}"
+    ids = [c["id"] for c in run]
+    packed = {
+        "id": "+".join(ids),
+        "ids": ids,
+        "text": text,
+        "metadata": dict(first, source=source),
+    }
+    scores = [c["score"] for c in run if c.get("score") is not None]
+    if scores:
+        packed["score"] = max(scores)
+    return packed
+
+
+@traced("pack_context")
+def pack_context(retrieved_chunks, chat_history_text="", model_name=None, budget=None):
+    """
+    Turn reranked chunks into prompt blocks that fit a token budget:
+
+      1. chunks from the same doc_id/para_idx with consecutive chunk_idx are
+         merged and their shared overlap text is removed; exact duplicates go
+      2. chat history is capped at HISTORY_BUDGET_SHARE of the budget (newest kept)
+      3. blocks are added in relevance order (best member's rank) while they fit;
+         the first block is truncated rather than dropped
+
+    Returns (blocks, chat_history_text). Blocks look like retrieved chunks
+    (id, text, metadata, score) plus "ids" of the chunks they contain, so
+    [Chunk N] in the prompt and previews both index into the returned list.
+    """
+    if budget is None:
+        budget = context_budget(model_name)
+
+    history_cap = int(budget * HISTORY_BUDGET_SHARE)
+    if count_tokens(chat_history_text) > history_cap:
+        chat_history_text = truncate_tokens(chat_history_text, history_cap, keep="tail")
+    remaining = budget - count_tokens(chat_history_text)
+
+    # Group by paragraph; chunks without position metadata stay on their own
+    groups, seen_text = {}, set()
+    for rank, chunk in enumerate(retrieved_chunks):
+        if chunk["text"] in seen_text:
+            continue
+        seen_text.add(chunk["text"])
+        meta = chunk.get("metadata") or {}
+        key = (meta.get("doc_id"), meta.get("para_idx")) if meta.get("para_idx") is not None else ("", chunk["id"])
+        groups.setdefault(key, []).append((rank, chunk))
+
+    runs = [run for members in groups.values() for run in _merge_group(members)]
+    runs.sort(key=lambda r: r[0])
+
+    blocks = []
+    for _, run in runs:
+        block = _packed_chunk(run)
+        cost = count_tokens(block["text"]) + CHUNK_HEADER_TOKENS
+        if cost > remaining:
+            if blocks:
+                continue   # a smaller, less relevant block may still fit
+            block["text"] = truncate_tokens(block["text"], max(remaining - CHUNK_HEADER_TOKENS, 0))
+            cost = remaining
+            if not block["text"]:
+                break
+        blocks.append(block)
+        remaining -= cost
+    return blocks, chat_history_text
@@ -1,13 +1,15 @@
 # file: embed_chunks.py
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from code.models import get_embedding_model
+from code.tracing import traced, record_count
 
-# 1) Load an open-source embedding model (no API required)
-model = SentenceTransformer("all-mpnet-base-v2")  
-# This is one of the best free embedding models
+# 1) Open-source embedding model (no API required): all-mpnet-base-v2,
+# one of the best free embedding models. Loaded lazily and shared with the
+# retriever through code/models.py, so a process only holds one copy.
 
-def embed_chunks(chunks):
+@traced("embed_chunks")
+def embed_chunks(chunks, show_progress_bar=True, batch_size=32):
     """
     Takes a list of chunk objects (from Step 1)
     Adds an embedding vector to each chunk.
@@ -15,11 +17,13 @@ def embed_chunks(chunks):
 
     # Extract the text for each chunk
     texts = [chunk["text"] for chunk in chunks]
+    record_count("embed_chunks", len(texts))
 
     # 2) Convert each chunk of text into a vector (embedding)
-    vectors = model.encode(
+    vectors = get_embedding_model().encode(
         texts,
-        show_progress_bar=True,
+        batch_size=batch_size,
+        show_progress_bar=show_progress_bar,
         convert_to_numpy=True,
         normalize_embeddings=True  # important for similarity search
     )
@@ -31,19 +35,26 @@ def embed_chunks(chunks):
     return chunks
 
 
-# Manual test example (optional)
+# Embed a document into the on-disk artifact (see embedding_artifact.py)
 if __name__ == "__main__":
-    import pickle
-    from code.ingest_and_chunk import ingest_document
-
-    # 1. Load your document
-    chunks = ingest_document("data/hackerrank_doc.txt")
-
-    # 2. Generate embeddings
-    embedded_chunks = embed_chunks(chunks)
-
-    # 3. Save to a pickle file
-    with open("data/chunks_with_embeddings.pkl", "wb") as f:
-        pickle.dump(embedded_chunks, f)
-
-    print("Saved chunks_with_embeddings.pkl successfully!")
+    import argparse
+    from code.ingest_and_chunk import iter_document_chunks
+    from code.embedding_artifact import ArtifactWriter, EMBEDDING_ARTIFACT_PATH
+    from code.models import EMBEDDING_MODEL_NAME
+    from code.pipeline import batched, EMBED_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description="Chunk + embed documents into a memory-mappable artifact.")
+    parser.add_argument("paths", nargs="*", default=["data/hackerrank_doc.txt"])
+    parser.add_argument("--out", default=str(EMBEDDING_ARTIFACT_PATH))
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--append", action="store_true", help="add to an existing artifact instead of replacing it")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with ArtifactWriter(args.out, EMBEDDING_MODEL_NAME, dtype=args.dtype, append=args.append) as writer:
+        for path in args.paths:
+            # 1. Stream the document's chunks, 2. embed them batch by batch, 3. append to the artifact
+            for batch in batched(iter_document_chunks(path), args.batch_size):
+                writer.append(embed_chunks(batch, show_progress_bar=False, batch_size=args.batch_size))
+
+    print(f"Saved {writer.header['count']} embedded chunks to {args.out}/")
@@ -0,0 +1,170 @@
+# file: embedding_artifact.py
+
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+# CONFIG: where embed_chunks writes and index_chroma reads precomputed embeddings
+EMBEDDING_ARTIFACT_PATH = Path(os.getenv("EMBEDDING_ARTIFACT_PATH", "data/chunks_with_embeddings"))
+ARTIFACT_FORMAT_VERSION = 1
+NPY_HEADER_BYTES = 128       # fixed-size .npy header, so the row count can be rewritten in place on append
+
+# Chunk fields stored per row (everything except the vector)
+RECORD_FIELDS = ("chunk_id", "doc_id", "source", "para_idx", "chunk_idx", "content_hash", "text")
+
+# On-disk layout (a directory):
+#   header.json     format version, model name, dim, dtype, normalized, row count
+#   embeddings.npy  one contiguous (rows, dim) matrix, float32 or float16
+#   chunks.jsonl    one JSON record per row, same order as the matrix
+# header.json is written last; its count is what readers trust, so rows from an
+# interrupted append are ignored (and cut off by the next append).
+
+
+def _npy_header(dtype, rows, dim):
+    """.npy v1.0 header padded to exactly NPY_HEADER_BYTES."""
+    text = "{'descr': %r, 'fortran_order': False, 'shape': (%d, %d), }" % (np.dtype(dtype).str, rows, dim)
+    prefix = b"\x93NUMPY\x01\x00"
+    body_len = NPY_HEADER_BYTES - len(prefix) - 2
+    body = text.ljust(body_len - 1) + "\n"
+    if len(body) != body_len:
+        raise ValueError("shape too large for the fixed .npy header")
+    return prefix + body_len.to_bytes(2, "little") + body.encode("latin1")
+
+
+def _write_json_atomic(path, data):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class ArtifactWriter:
+    """
+    Streams embedded chunks into an artifact directory. append=True continues
+    an existing artifact (same model/dim/dtype) instead of starting over.
+
+        with ArtifactWriter(path, model_name) as writer:
+            for batch in ...:
+                writer.append(embedded_chunks)
+    """
+
+    def __init__(self, path=EMBEDDING_ARTIFACT_PATH, model_name="", dtype="float32", normalized=True, append=False):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.header_path = self.path / "header.json"
+        self.emb_path = self.path / "embeddings.npy"
+        self.rec_path = self.path / "chunks.jsonl"
+
+        if append and self.header_path.exists():
+            self.header = json.loads(self.header_path.read_text(encoding="utf-8"))
+            if model_name and self.header["model"] != model_name:
+                raise ValueError(f"Artifact was built with {self.header['model']!r}, not {model_name!r}")
+            self._truncate_to(self.header["count"])
+        else:
+            self.header = {
+                "format_version": ARTIFACT_FORMAT_VERSION,
+                "model": model_name,
+                "dim": None,
+                "dtype": np.dtype(dtype).name,
+                "normalized": normalized,
+                "count": 0,
+                "created_at": time.time(),
+            }
+            for p in (self.header_path, self.emb_path, self.rec_path):
+                if p.exists():
+                    p.unlink()
+        self.dtype = np.dtype(self.header["dtype"])
+
+    def _truncate_to(self, count):
+        """Drop rows past `count` left behind by an interrupted append."""
+        if self.header["dim"]:
+            with open(self.emb_path, "r+b") as f:
+                f.truncate(NPY_HEADER_BYTES + count * self.header["dim"] * np.dtype(self.header["dtype"]).itemsize)
+        if self.rec_path.exists():
+            with open(self.rec_path, "rb") as f:
+                lines = f.readlines()
+            if len(lines) != count:
+                with open(self.rec_path, "wb") as f:
+                    f.writelines(lines[:count])
+
+    def append(self, chunks):
+        """Add embedded chunks (dicts with "embedding" plus RECORD_FIELDS)."""
+        if not chunks:
+            return
+        matrix = np.stack([c["embedding"] for c in chunks]).astype(self.dtype, copy=False)
+        if self.header["dim"] is None:
+            self.header["dim"] = int(matrix.shape[1])
+            with open(self.emb_path, "wb") as f:
+                f.write(_npy_header(self.dtype, 0, self.header["dim"]))
+        elif matrix.shape[1] != self.header["dim"]:
+            raise ValueError(f"Embedding dim {matrix.shape[1]} != artifact dim {self.header['dim']}")
+
+        with open(self.emb_path, "ab") as f:
+            f.write(np.ascontiguousarray(matrix).tobytes())
+        with open(self.rec_path, "a", encoding="utf-8") as f:
+            for c in chunks:
+                f.write(json.dumps({k: c.get(k) for k in RECORD_FIELDS}, ensure_ascii=False) + "\n")
+
+        count = self.header["count"] + len(chunks)
+        with open(self.emb_path, "r+b") as f:
+            f.write(_npy_header(self.dtype, count, self.header["dim"]))
+        self.header["count"] = count
+        _write_json_atomic(self.header_path, self.header)
+
+    def close(self):
+        if not self.header_path.exists():
+            _write_json_atomic(self.header_path, self.header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EmbeddingArtifact:
+    """
+    Read side: the matrix is memory-mapped (nothing loaded up front, pages
+    shared between processes) and batches are handed out as zero-copy views.
+    """
+
+    def __init__(self, path=EMBEDDING_ARTIFACT_PATH):
+        self.path = Path(path)
+        self.header = json.loads((self.path / "header.json").read_text(encoding="utf-8"))
+        if self.header.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact format: {self.header.get('format_version')}")
+        self.count = self.header["count"]
+        if self.count and self.header["dim"]:
+            self.embeddings = np.memmap(
+                self.path / "embeddings.npy", dtype=self.header["dtype"], mode="r",
+                offset=NPY_HEADER_BYTES, shape=(self.count, self.header["dim"]),
+            )
+        else:
+            self.embeddings = np.zeros((0, self.header["dim"] or 0), dtype=self.header["dtype"])
+
+    @property
+    def model(self):
+        return self.header["model"]
+
+    def __len__(self):
+        return self.count
+
+    def iter_records(self):
+        with open(self.path / "chunks.jsonl", encoding="utf-8") as f:
+            for _, line in zip(range(self.count), f):
+                yield json.loads(line)
+
+    def iter_batches(self, batch_size=1024):
+        """(records, embeddings view) per batch, in row order."""
+        records, start = [], 0
+        for record in self.iter_records():
+            records.append(record)
+            if len(records) == batch_size:
+                yield records, self.embeddings[start:start + batch_size]
+                start += batch_size
+                records = []
+        if records:
+            yield records, self.embeddings[start:start + len(records)]
+
@@ -0,0 +1,123 @@
+# file: fake_llm_server.py
+
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+# CONFIG: behaviour of the stand-in LLM (override via env or CLI flags)
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))          # time to first token
+FAKE_LLM_TOKENS_PER_S = float(os.getenv("FAKE_LLM_TOKENS_PER_S", "250"))      # generation speed
+FAKE_LLM_COMPLETION_TOKENS = int(os.getenv("FAKE_LLM_COMPLETION_TOKENS", "80"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))    # share of calls answered 429/503 (exercise retries)
+FAKE_LLM_SLOW_RATE = float(os.getenv("FAKE_LLM_SLOW_RATE", "0"))      # share of calls that stall first (exercise hedging)
+FAKE_LLM_SLOW_MS = float(os.getenv("FAKE_LLM_SLOW_MS", "3000"))
+
+# Offline stand-in for the Groq API (OpenAI-compatible chat completions, plain
+# and streamed). Point the app at it with LLM_BASE_URL=http://127.0.0.1:<port>/v1.
+app = FastAPI()
+app.state.latency_ms = FAKE_LLM_LATENCY_MS
+app.state.tokens_per_s = FAKE_LLM_TOKENS_PER_S
+app.state.completion_tokens = FAKE_LLM_COMPLETION_TOKENS
+app.state.error_rate = FAKE_LLM_ERROR_RATE
+app.state.slow_rate = FAKE_LLM_SLOW_RATE
+app.state.slow_ms = FAKE_LLM_SLOW_MS
+app.state.calls = 0
+
+WORDS = ("Based on the document, the answer involves the relevant data structure and its "
+         "time complexity as described [Chunk 0], with further detail in [Chunk 1].").split()
+
+
+def fake_tokens(n):
+    return [WORDS[i % len(WORDS)] + " " for i in range(n)]
+
+
+def usage_for(body, n_completion):
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    n_prompt = max(prompt_chars // 4, 1)   # ~4 chars per token is close enough for a benchmark
+    return {"prompt_tokens": n_prompt, "completion_tokens": n_completion, "total_tokens": n_prompt + n_completion}
+
+
+async def completions(request: Request):
+    body = await request.json()
+    state = request.app.state
+    state.calls += 1
+    if random.random() < state.error_rate:
+        status = random.choice((429, 503))
+        return JSONResponse({"error": {"message": "injected failure"}}, status_code=status, headers={"Retry-After": "0"})
+    if random.random() < state.slow_rate:
+        await asyncio.sleep(state.slow_ms / 1000.0)
+    n = int(body.get("max_tokens") or state.completion_tokens)
+    n = min(n, state.completion_tokens)
+    tokens = fake_tokens(n)
+    created = int(time.time())
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "fake")
+    usage = usage_for(body, n)
+    per_token_s = 1.0 / state.tokens_per_s if state.tokens_per_s > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(state.latency_ms / 1000.0 + n * per_token_s)
+        return {
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def events():
+        def chunk(delta, finish=None, **extra):
+            data = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            return f"data: {json.dumps(data)}\n\n"
+
+        await asyncio.sleep(state.latency_ms / 1000.0)
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            yield chunk({"content": token})
+            if per_token_s:
+                await asyncio.sleep(per_token_s)
+        # Groq reports usage on the last chunk under x_groq, OpenAI under usage
+        yield chunk({}, "stop", x_groq={"usage": usage}, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# Groq's SDK posts to /openai/v1/...; plain OpenAI-style clients to /v1/...
+app.add_api_route("/openai/v1/chat/completions", completions, methods=["POST"])
+app.add_api_route("/v1/chat/completions", completions, methods=["POST"])
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", "calls": app.state.calls}
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI/Groq-compatible LLM server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=FAKE_LLM_LATENCY_MS)
+    parser.add_argument("--tokens-per-s", type=float, default=FAKE_LLM_TOKENS_PER_S)
+    parser.add_argument("--completion-tokens", type=int, default=FAKE_LLM_COMPLETION_TOKENS)
+    parser.add_argument("--error-rate", type=float, default=FAKE_LLM_ERROR_RATE)
+    parser.add_argument("--slow-rate", type=float, default=FAKE_LLM_SLOW_RATE)
+    parser.add_argument("--slow-ms", type=float, default=FAKE_LLM_SLOW_MS)
+    args = parser.parse_args()
+
+    app.state.latency_ms = args.latency_ms
+    app.state.tokens_per_s = args.tokens_per_s
+    app.state.completion_tokens = args.completion_tokens
+    app.state.error_rate = args.error_rate
+    app.state.slow_rate = args.slow_rate
+    app.state.slow_ms = args.slow_ms
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
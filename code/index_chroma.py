@@ -1,49 +1,197 @@
 # file: index_chroma.py
 
-import chromadb
+import numpy as np
+from code.index_version import bump_index_version
+from code.models import get_vector_store, EMBEDDING_MODEL_NAME
+from code.embedding_artifact import EmbeddingArtifact, EMBEDDING_ARTIFACT_PATH
+from code.bm25 import get_bm25_index, save_bm25_index
+from code.manifest import load_manifest
+from code.precompute import invalidate_precomputed
+from code.tracing import traced, stage_summary
 
-# NEW Chroma client style (2024+)
-client = chromadb.PersistentClient(path="chroma_db")
+# The vector store (Chroma PersistentClient by default, or the NumPy backend via
+# VECTOR_BACKEND=numpy) comes from the shared registry in code/models.py
 
-def index_in_chroma(chunks):
-    """
-    Saves chunk embeddings and metadata into a Chroma vector database.
-    """
+def chunk_metadata(chunk):
+    """Vector-store metadata for a chunk dict (or an artifact record)."""
+    return {
+        "doc_id": chunk["doc_id"],
+        "source": chunk["source"],
+        "para_idx": chunk["para_idx"],
+        "chunk_idx": chunk["chunk_idx"],
+        "content_hash": chunk.get("content_hash") or "",
+        # Tags as booleans ("tag:<name>": True) so a where clause can filter on them;
+        # tags removed from a document are written as False
+        **{f"tag:{name}": on for name, on in (chunk.get("tags") or {}).items()},
+    }
 
-    # Create or load collection
-    collection = client.get_or_create_collection(
-        name="hackerrank_chunks",
-        metadata={"hnsw:space": "cosine"}  # similarity metric
-    )
 
-    ids = [chunk["chunk_id"] for chunk in chunks]
-    embeddings = [chunk["embedding"].tolist() for chunk in chunks]
-    documents = [chunk["text"] for chunk in chunks]
-    metadatas = [
-        {
-            "doc_id": chunk["doc_id"],
-            "source": chunk["source"],
-            "para_idx": chunk["para_idx"],
-            "chunk_idx": chunk["chunk_idx"]
-        }
-        for chunk in chunks
-    ]
-
-    # Insert into vector DB
-    collection.add(
+@traced("index_upsert")
+def upsert_rows(ids, embeddings, documents, metadatas):
+    """
+    Writes embeddings (one (n, dim) float32 matrix), text and metadata to the
+    vector store (upsert, so the same chunk IDs never create duplicates) and
+    to the in-memory BM25 index.
+    Callers batching many writes call commit_index_changes() once at the end.
+    """
+    # Insert or overwrite in vector DB
+    get_vector_store().upsert(
         ids=ids,
         documents=documents,
         embeddings=embeddings,
         metadatas=metadatas
     )
 
-    print(f"Indexed {len(ids)} chunks into Chroma!")
+    # Keep the lexical index in step with the vector store
+    get_bm25_index().add_many(ids, documents)
+
+
+def upsert_chunks(chunks):
+    """upsert_rows() for chunk dicts carrying an "embedding"."""
+    if not chunks:
+        return
+    # One float32 matrix instead of a Python list per vector
+    embeddings = np.stack([chunk["embedding"] for chunk in chunks]).astype(np.float32, copy=False)
+    upsert_rows(
+        [chunk["chunk_id"] for chunk in chunks],
+        embeddings,
+        [chunk["text"] for chunk in chunks],
+        [chunk_metadata(chunk) for chunk in chunks],
+    )
+
+
+@traced("index_commit")
+def commit_index_changes():
+    """Flush the vector store, persist BM25 and bump the index version (invalidates answer caches)."""
+    get_vector_store().flush()
+    save_bm25_index()
+    bump_index_version()
+
+
+@traced("index_in_chroma")
+def index_in_chroma(chunks):
+    """
+    Saves chunk embeddings and metadata into a Chroma vector database.
+    Uses upsert, so re-indexing the same chunk IDs never creates duplicates.
+    """
+
+    if not chunks:
+        return
+
+    upsert_chunks(chunks)
+
+    # Persist BM25 + invalidate answer caches that depend on the old index contents
+    commit_index_changes()
+
+    print(f"Indexed {len(chunks)} chunks into Chroma!")
+
+
+@traced("index_artifact")
+def index_artifact(path=EMBEDDING_ARTIFACT_PATH, batch_size=1024):
+    """
+    Index a precomputed embedding artifact (see embedding_artifact.py). The
+    matrix is memory-mapped and handed over batch by batch, so memory stays
+    at one batch regardless of corpus size.
+    """
+    artifact = EmbeddingArtifact(path)
+    if artifact.model and artifact.model != EMBEDDING_MODEL_NAME:
+        raise ValueError(
+            f"{path} was embedded with {artifact.model!r} but queries use {EMBEDDING_MODEL_NAME!r}; re-run embed_chunks"
+        )
+    for records, vectors in artifact.iter_batches(batch_size):
+        upsert_rows(
+            [r["chunk_id"] for r in records],
+            np.asarray(vectors, dtype=np.float32),   # a view for float32 artifacts; float16 is upcast per batch
+            [r["text"] for r in records],
+            [chunk_metadata(r) for r in records],
+        )
+    commit_index_changes()
+    print(f"Indexed {len(artifact)} chunks from {path}")
+    return len(artifact)
+
+
+@traced("index_delete")
+def delete_from_chroma(ids, commit=True):
+    """
+    Remove chunks by ID (e.g. paragraphs deleted from the source document).
+    commit=False leaves commit_index_changes() to the caller, so deletes and
+    upserts of one sync become visible together.
+    """
+    if not ids:
+        return
+    get_vector_store().delete(ids)
+    get_bm25_index().remove_many(ids)
+    if commit:
+        commit_index_changes()
+    # Precomputed answers built from these chunks must be recomputed
+    invalidated = invalidate_precomputed(ids)
+    print(f"Deleted {len(ids)} stale chunks from Chroma ({invalidated} precomputed answers invalidated).")
+
+
+def indexed_state(doc_id):
+    """
+    {chunk_id: content_hash} currently indexed for a document.
+    Falls back to asking Chroma when there is no manifest yet (e.g. an index
+    built before manifests existed), so old chunks still get cleaned up.
+    """
+    manifest = load_manifest(doc_id)
+    if manifest is not None:
+        return manifest
+    existing = get_vector_store().get(where={"doc_id": doc_id}, include=["metadatas"])
+    return {cid: (meta or {}).get("content_hash", "") for cid, meta in zip(existing["ids"], existing["metadatas"])}
+
+
+def reuse_embeddings(new_chunks, old_state):
+    """
+    Chunks whose text already exists in the index under another ID (moved
+    paragraph, renumbered chunk) take their stored embedding instead of
+    being re-embedded. Returns the chunks that still need embedding.
+    """
+    old_by_hash = {h: cid for cid, h in old_state.items() if h}
+    reusable = [c for c in new_chunks if c["content_hash"] in old_by_hash]
+    if not reusable:
+        return new_chunks
+
+    source_ids = list({old_by_hash[c["content_hash"]] for c in reusable})
+    stored = get_vector_store().get(ids=source_ids, include=["embeddings"])
+    vectors = {cid: np.asarray(vec, dtype=np.float32) for cid, vec in zip(stored["ids"], stored["embeddings"])}
+
+    to_embed = []
+    for c in new_chunks:
+        vec = vectors.get(old_by_hash.get(c["content_hash"]))
+        if vec is not None:
+            c["embedding"] = vec
+        else:
+            to_embed.append(c)
+    return to_embed
+
+
+def sync_document(path, tags=None):
+    """
+    Idempotent, incremental (re)indexing of one document:
+      - chunk the document (content-addressed IDs)
+      - embed only chunks that are not indexed yet, reusing stored vectors for moved text
+      - upsert them, delete chunks that disappeared from the source
+      - record the new state in the document's manifest
+    Runs through the streaming pipeline (code/pipeline.py), so memory stays
+    bounded regardless of document size.
+    """
+    from code.pipeline import run_pipeline
+
+    stats = run_pipeline(path, tags=tags)
+    print(f"Synced {stats['doc_id']}: {stats}")
+    return stats
 
 
 if __name__ == "__main__":
-    import pickle
-    
-    with open("data/chunks_with_embeddings.pkl", "rb") as f:
-        chunks = pickle.load(f)
+    import sys
+
+    if len(sys.argv) > 1:
+        # Incremental: python -m code.index_chroma data/hackerrank_doc.txt [more docs...]
+        for doc_path in sys.argv[1:]:
+            sync_document(doc_path)
+    else:
+        # Bulk load of the artifact written by `python -m code.embed_chunks`
+        index_artifact()
 
-    index_in_chroma(chunks)
+    print(f"Stage timings: {stage_summary()}")
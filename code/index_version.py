@@ -0,0 +1,33 @@
+# file: index_version.py
+
+import os
+import time
+from pathlib import Path
+
+# A tiny marker file next to the vector store; rewritten whenever the index changes.
+# Caches keyed on index contents compare against it (cheap os.stat per request).
+INDEX_VERSION_PATH = Path(os.getenv("INDEX_VERSION_PATH", "chroma_db/index_version"))
+
+_cached = {"mtime_ns": None, "version": "0"}
+
+
+def bump_index_version():
+    """Call after any write to the index (add/upsert/delete)."""
+    INDEX_VERSION_PATH.parent.mkdir(parents=True, exist_ok=True)
+    version = str(time.time_ns())
+    tmp = INDEX_VERSION_PATH.with_suffix(".tmp")
+    tmp.write_text(version)
+    os.replace(tmp, INDEX_VERSION_PATH)
+    return version
+
+
+def get_index_version():
+    """Current index version string ("0" if the index was never written through index_chroma)."""
+    try:
+        mtime_ns = INDEX_VERSION_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return "0"
+    if mtime_ns != _cached["mtime_ns"]:
+        _cached["version"] = INDEX_VERSION_PATH.read_text().strip()
+        _cached["mtime_ns"] = mtime_ns
+    return _cached["version"]
@@ -0,0 +1,272 @@
+# file: inference_server.py
+
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from code.vector_store import VectorStore
+
+# CONFIG: shared model-serving process (override via env or CLI flags)
+# Unset = every process loads its own models (the default). Several servers can
+# be listed comma-separated: embed/rerank calls are spread over all of them, but
+# every vector-store call goes to the first one, the only server that opens the
+# store (the others run with --no-store). Each server would otherwise hold its
+# own store: NumPy-backend upserts buffered on one server and flushed on another
+# would be lost, and a Chroma PersistentClient must not be opened by several processes.
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "rag-inference").encode("utf-8")
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))   # collect query embeds across workers this long
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "128"))               # flush the embed batch early at this size
+CONNECT_RETRY_S = 10.0                                                  # clients wait this long for a starting server
+
+# Vector-store calls a client may forward (reads for the API, writes for /upload + indexing)
+STORE_METHODS = {"query", "get", "count", "upsert", "delete", "flush"}
+ROTATED_OPS = {"embed", "rerank"}    # stateless: may go to any server
+
+
+class InferenceServerError(RuntimeError):
+    """The server raised while handling a request (message carries the remote error)."""
+
+
+# ───────────────────────────────────────────────
+# Server side
+# ───────────────────────────────────────────────
+class EmbedScheduler:
+    """
+    Same idea as rerank_batcher.RerankScheduler, for the embedding model:
+    encode() calls arriving from different API workers within a short window
+    are run as one model.encode batch.
+    """
+
+    def __init__(self, model, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH):
+        self.model = model
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, name="embed-batcher", daemon=True).start()
+
+    def encode(self, texts, normalize_embeddings=False):
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        fut = Future()
+        self._queue.put((list(texts), bool(normalize_embeddings), fut))
+        return fut.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        n = len(batch[0][0])
+        deadline = time.monotonic() + self.window_s
+        while n < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n += len(item[0])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            # normalize_embeddings differs between indexing and queries: one encode per flag
+            for normalize in (False, True):
+                group = [item for item in batch if item[1] == normalize]
+                if not group:
+                    continue
+                flat = [text for texts, _, _ in group for text in texts]
+                try:
+                    vectors = self.model.encode(flat, convert_to_numpy=True, normalize_embeddings=normalize,
+                                                show_progress_bar=False)
+                except Exception as e:
+                    for _, _, fut in group:
+                        fut.set_exception(e)
+                    continue
+                offset = 0
+                for texts, _, fut in group:
+                    fut.set_result(np.asarray(vectors[offset:offset + len(texts)], dtype=np.float32))
+                    offset += len(texts)
+
+
+class InferenceServer:
+    """
+    Owns the embedding model, the reranker (with its cross-request batcher)
+    and the vector store for every API worker on the host. Each client
+    connection gets a thread; requests are (op, args, kwargs) tuples.
+    with_store=False serves embed/rerank only (additional servers).
+    """
+
+    def __init__(self, address, with_store=True):
+        from code import models
+
+        self.address = address
+        models.warmup(include_store=with_store)
+        self.embedder = EmbedScheduler(models.get_embedding_model())
+        self.reranker = models.get_rerank_scheduler()
+        self.store = models.get_vector_store() if with_store else None
+
+    def handle(self, op, args, kwargs):
+        if op == "embed":
+            return self.embedder.encode(*args, **kwargs)
+        if op == "rerank":
+            return self.reranker.score(*args, **kwargs)
+        if op.startswith("store.") and op[6:] in STORE_METHODS:
+            if self.store is None:
+                raise ValueError("This server runs with --no-store; vector-store calls go to the first address")
+            return getattr(self.store, op[6:])(*args, **kwargs)
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"Unknown op {op!r}")
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self.handle(op, args, kwargs))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except (OSError, BrokenPipeError):
+                    return
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)   # stale socket from a previous run
+        with Listener(self.address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY) as listener:
+            os.chmod(self.address, 0o600)   # only this user's processes may connect
+            print(f"Inference server listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    continue   # failed handshake (wrong authkey etc.)
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+# ───────────────────────────────────────────────
+# Client side (used by API workers when INFERENCE_SERVER_ADDRESS is set)
+# ───────────────────────────────────────────────
+class InferenceClient:
+    """
+    Thread-safe client: a pool of idle connections per server, so concurrent
+    retrieval threads never share one. Embed/rerank calls rotate over the
+    configured servers; everything else (vector-store reads and writes) goes
+    to the first one, so a single store sees every write in order.
+    """
+
+    def __init__(self, addresses=INFERENCE_SERVER_ADDRESS):
+        self.addresses = [a.strip() for a in addresses.split(",") if a.strip()]
+        if not self.addresses:
+            raise ValueError("No inference server address configured")
+        self._idle = {address: queue.LifoQueue() for address in self.addresses}
+        self._next = itertools.cycle(self.addresses)
+        self._lock = threading.Lock()
+
+    def _connect(self, address):
+        deadline = time.monotonic() + CONNECT_RETRY_S
+        while True:
+            try:
+                return Client(address, family="AF_UNIX", authkey=INFERENCE_SERVER_AUTHKEY)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+
+    def call(self, op, *args, **kwargs):
+        if op in ROTATED_OPS:
+            with self._lock:
+                address = next(self._next)
+        else:
+            address = self.addresses[0]
+        try:
+            conn = self._idle[address].get_nowait()
+        except queue.Empty:
+            conn = self._connect(address)
+        try:
+            conn.send((op, args, kwargs))
+            status, value = conn.recv()
+        except Exception:
+            conn.close()   # broken connection: don't return it to the pool
+            raise
+        self._idle[address].put(conn)
+        if status == "error":
+            raise InferenceServerError(value)
+        return value
+
+
+class RemoteEmbedder:
+    """Stands in for the SentenceTransformer: encode() runs on the inference server."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, **_):
+        return self.client.call("embed", list(texts), normalize_embeddings=normalize_embeddings)
+
+
+class RemoteRerankScheduler:
+    """Stands in for the RerankScheduler: pairs from every worker are batched together on the server."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def score(self, texts):
+        return self.client.call("rerank", list(texts)) if texts else []
+
+
+class RemoteVectorStore(VectorStore):
+    """VectorStore whose calls run against the server's single store instance."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        return self.client.call("store.upsert", ids, np.asarray(embeddings, dtype=np.float32), documents, metadatas)
+
+    def delete(self, ids):
+        return self.client.call("store.delete", list(ids))
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances"), where=None):
+        return self.client.call("store.query", np.asarray(query_embeddings, dtype=np.float32),
+                                n_results=n_results, include=list(include), where=where)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        return self.client.call("store.get", ids=ids, where=where, include=list(include), limit=limit, offset=offset)
+
+    def count(self):
+        return self.client.call("store.count")
+
+    def flush(self):
+        return self.client.call("store.flush")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve embed / rerank / vector search to all API workers on this host.")
+    parser.add_argument("--address", default=INFERENCE_SERVER_ADDRESS.split(",")[0] or "/tmp/rag-inference.sock",
+                        help="Unix socket path")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads for the models (default: INFERENCE_THREADS)")
+    parser.add_argument("--no-store", action="store_true",
+                        help="embed/rerank only; for servers after the first in INFERENCE_SERVER_ADDRESS")
+    args = parser.parse_args()
+
+    from code import models
+    # This process is the server: it must load the models itself, not proxy to another server
+    models.INFERENCE_SERVER_ADDRESS = ""
+    if args.threads:
+        models.INFERENCE_THREADS = args.threads
+    InferenceServer(args.address, with_store=not args.no_store).serve_forever()
@@ -1,47 +1,203 @@
 # file: ingest_and_chunk.py
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Iterator, List
+import hashlib
+import os
 import re
-import uuid
+import time
+import numpy as np
 import tiktoken
 from pathlib import Path
+from code.tracing import traced, stage_summary
+
+# CONFIG: chunking defaults
+MAX_TOKENS = 350
+OVERLAP_TOKENS = 50
+TOKENIZER_NAME = "cl100k_base"
+PARAGRAPH_BATCH_SIZE = int(os.getenv("CHUNK_PARAGRAPH_BATCH", "256"))   # paragraphs per encode_ordinary_batch call
+ENCODE_THREADS = int(os.getenv("CHUNK_ENCODE_THREADS", str(min(8, os.cpu_count() or 1))))
 
 def naive_paragraph_split(text: str) -> List[str]:
     paras = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
     return paras
 
-def chunk_paragraph(paragraph: str, max_tokens=350, overlap_tokens=50, tokenizer_name="cl100k_base"):
-    enc = tiktoken.get_encoding(tokenizer_name)
-    toks = enc.encode(paragraph)
-    chunks = []
+@lru_cache(maxsize=None)
+def get_encoder(tokenizer_name: str = TOKENIZER_NAME):
+    """One tiktoken encoder per process."""
+    return tiktoken.get_encoding(tokenizer_name)
+
+@lru_cache(maxsize=None)
+def token_byte_lengths(tokenizer_name: str = TOKENIZER_NAME) -> np.ndarray:
+    """
+    Lookup table token_id -> length of its UTF-8 bytes. Built once per
+    process; lets us turn token windows into byte offsets with a cumsum
+    instead of decoding every window.
+    """
+    enc = get_encoder(tokenizer_name)
+    lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+    for token in range(enc.n_vocab):
+        try:
+            lengths[token] = len(enc.decode_single_token_bytes(token))
+        except KeyError:
+            pass   # unused ids between the BPE ranks and special tokens
+    return lengths
+
+def token_windows(n_tokens: int, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """(start, end) token windows, each overlapping the previous by overlap_tokens."""
     start = 0
-    while start < len(toks):
-        end = min(start + max_tokens, len(toks))
-        chunk_tokens = toks[start:end]
-        chunks.append(enc.decode(chunk_tokens))
-        if end == len(toks):
+    while start < n_tokens:
+        end = min(start + max_tokens, n_tokens)
+        yield start, end
+        if end == n_tokens:
             break
         start = end - overlap_tokens
-    return chunks
-
-def ingest_document(path: str):
-    text = Path(path).read_text(encoding='utf-8')
-    paras = naive_paragraph_split(text)
-    all_chunks = []
-    for pidx, para in enumerate(paras):
-        para_chunks = chunk_paragraph(para)
-        for cidx, ch in enumerate(para_chunks):
-            chunk_obj = {
-                "doc_id": Path(path).stem,
-                "para_idx": pidx,
-                "chunk_idx": cidx,
-                "chunk_id": str(uuid.uuid4()),
-                "text": ch,
-                "source": f"{path}#para{pidx}:chunk{cidx}"
-            }
-            all_chunks.append(chunk_obj)
-    return all_chunks
+
+def _char_boundary(data: bytes, pos: int) -> int:
+    # Move back to the start of a UTF-8 character if pos points into one
+    while 0 < pos < len(data) and 0x80 <= data[pos] < 0xC0:
+        pos -= 1
+    return pos
+
+@traced("chunk")
+def chunk_paragraphs(paragraphs: List[str], max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS,
+                     tokenizer_name=TOKENIZER_NAME, stats=None) -> List[List[str]]:
+    """
+    Chunk many paragraphs at once: one batched tokenizer call, then windows
+    are cut out of each paragraph's UTF-8 bytes using cumulative token byte
+    lengths (no per-window decode). A character split across a window
+    boundary is kept whole. Returns one list of chunk strings per paragraph.
+
+    If `stats` is a dict, paragraph/token/chunk counts are added to it.
+    """
+    enc = get_encoder(tokenizer_name)
+    byte_lengths = token_byte_lengths(tokenizer_name)
+    if ENCODE_THREADS > 1 and len(paragraphs) > 1:
+        token_lists = enc.encode_ordinary_batch(paragraphs, num_threads=ENCODE_THREADS)
+    else:
+        # Single core / single paragraph: skip the batch API's thread pool overhead
+        token_lists = [enc.encode_ordinary(p) for p in paragraphs]
+
+    results = []
+    n_tokens = n_chunks = 0
+    for para, toks in zip(paragraphs, token_lists):
+        n_tokens += len(toks)
+        if len(toks) <= max_tokens:
+            results.append([para] if toks else [])
+            n_chunks += 1 if toks else 0
+            continue
+
+        data = para.encode("utf-8")
+        offsets = np.concatenate(([0], np.cumsum(byte_lengths[np.asarray(toks)])))
+        chunks = []
+        for start, end in token_windows(len(toks), max_tokens, overlap_tokens):
+            b_start = _char_boundary(data, int(offsets[start]))
+            b_end = len(data) if end == len(toks) else _char_boundary(data, int(offsets[end]))
+            chunks.append(data[b_start:b_end].decode("utf-8"))
+        results.append(chunks)
+        n_chunks += len(chunks)
+
+    if stats is not None:
+        stats["paragraphs"] = stats.get("paragraphs", 0) + len(paragraphs)
+        stats["tokens"] = stats.get("tokens", 0) + n_tokens
+        stats["chunks"] = stats.get("chunks", 0) + n_chunks
+    return results
+
+def chunk_paragraph(paragraph: str, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS, tokenizer_name=TOKENIZER_NAME):
+    return chunk_paragraphs([paragraph], max_tokens, overlap_tokens, tokenizer_name)[0]
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def make_chunk_id(doc_id: str, para_idx: int, chunk_idx: int, text_hash: str) -> str:
+    """
+    Deterministic, content-addressed chunk ID: re-ingesting an unchanged
+    document yields the same IDs, and an edited chunk gets a new one.
+    """
+    return f"{doc_id}:p{para_idx}:c{chunk_idx}:{text_hash[:16]}"
+
+def iter_paragraphs(path: str) -> Iterator[str]:
+    """
+    Streaming equivalent of naive_paragraph_split(): reads the file line by
+    line and yields paragraphs separated by blank lines, so memory is bounded
+    by the largest paragraph rather than the file size.
+    """
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                lines.append(line.rstrip("\n"))
+            elif lines:
+                yield "\n".join(lines).strip()
+                lines = []
+    if lines:
+        yield "\n".join(lines).strip()
+
+def iter_document_chunks(path: str, stats=None) -> Iterator[dict]:
+    """Yields chunk dicts one at a time (same shape as ingest_document())."""
+    doc_id = Path(path).stem
+    paragraphs = enumerate(iter_paragraphs(path))
+    while True:
+        batch = list(islice(paragraphs, PARAGRAPH_BATCH_SIZE))
+        if not batch:
+            return
+        chunked = chunk_paragraphs([para for _, para in batch], stats=stats)
+        for (pidx, _), para_chunks in zip(batch, chunked):
+            for cidx, ch in enumerate(para_chunks):
+                text_hash = content_hash(ch)
+                yield {
+                    "doc_id": doc_id,
+                    "para_idx": pidx,
+                    "chunk_idx": cidx,
+                    "chunk_id": make_chunk_id(doc_id, pidx, cidx, text_hash),
+                    "content_hash": text_hash,
+                    "text": ch,
+                    "source": f"{path}#para{pidx}:chunk{cidx}"
+                }
+
+@traced("ingest_document")
+def ingest_document(path: str, stats=None):
+    return list(iter_document_chunks(path, stats=stats))
+
+def _ingest_with_stats(path: str):
+    stats = {}
+    chunks = ingest_document(path, stats=stats)
+    return path, chunks, stats
+
+def ingest_documents(paths: List[str], workers=None) -> Iterator[tuple]:
+    """
+    Chunk many documents in parallel across processes (one encoder per
+    worker process). Yields (path, chunks, stats) in input order.
+    """
+    if workers == 1 or len(paths) <= 1:
+        for path in paths:
+            yield _ingest_with_stats(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_ingest_with_stats, paths)
+
+def report_throughput(stats: dict, seconds: float) -> str:
+    tokens = stats.get("tokens", 0)
+    rate = tokens / seconds if seconds > 0 else float("inf")
+    return (f"{stats.get('paragraphs', 0)} paragraphs, {tokens} tokens, {stats.get('chunks', 0)} chunks "
+            f"in {seconds:.3f}s ({rate:,.0f} tokens/sec)")
 
 if __name__ == "__main__":
-    chunks = ingest_document("data/hackerrank_doc.txt")
-    print(f"Total chunks: {len(chunks)}")
-    print(chunks[0])
+    import sys
+
+    paths = sys.argv[1:] or ["data/hackerrank_doc.txt"]
+    start = time.perf_counter()
+    totals = {}
+    first_chunk = None
+    for path, chunks, stats in ingest_documents(paths, workers=os.cpu_count()):
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+        if first_chunk is None and chunks:
+            first_chunk = chunks[0]
+    elapsed = time.perf_counter() - start
+
+    print(f"Total chunks: {totals.get('chunks', 0)}")
+    print(f"Chunking throughput: {report_throughput(totals, elapsed)}")
+    print(first_chunk)
+    print(f"Stage timings: {stage_summary()}")
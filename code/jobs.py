@@ -0,0 +1,136 @@
+# file: jobs.py
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from code.tracing import STAGE_ERRORS
+
+# CONFIG: uploads and background ingestion (override via env)
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "data"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))   # larger uploads get a 413
+UPLOAD_CHUNK_BYTES = 1024 * 1024                                              # copied to disk this much at a time
+UPLOAD_EXTENSIONS = (".txt", ".md")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))       # ingestion jobs running at once
+INGEST_NICE = int(os.getenv("INGEST_NICE", "10"))            # niceness of ingestion threads (Linux)
+INGEST_YIELD_MAX_S = float(os.getenv("INGEST_YIELD_MAX_S", "2"))   # max pause per batch while chats are running
+JOBS_KEPT = 200                                              # finished jobs remembered for /jobs
+
+
+def sanitize_filename(name):
+    """
+    Client-supplied filename -> safe basename inside UPLOAD_DIR (no paths,
+    no hidden files, only [A-Za-z0-9._-]). Raises ValueError if nothing usable is left
+    or the extension is not a supported text format.
+    """
+    base = re.split(r"[\\/]", name or "")[-1]
+    base = re.sub(r"[^A-Za-z0-9._-]", "_", base).lstrip(".")
+    stem, ext = os.path.splitext(base)
+    if not stem.strip("_"):
+        raise ValueError("Invalid filename")
+    if ext.lower() not in UPLOAD_EXTENSIONS:
+        raise ValueError(f"Unsupported file type {ext or '(none)'}; expected one of {', '.join(UPLOAD_EXTENSIONS)}")
+    return stem[:100] + ext.lower()
+
+
+def _lower_thread_priority():
+    """Executor initializer: make this worker thread nicer than the request-serving threads."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), INGEST_NICE)
+    except (AttributeError, OSError):
+        pass   # not Linux / not permitted: the yield-to-chats pause still applies
+
+
+class Job:
+    def __init__(self, path, tags=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = str(path)
+        self.tags = tags
+        self.state = "queued"          # queued | running | done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.error = None
+
+    def as_dict(self):
+        now = time.time()
+        return {
+            "id": self.id,
+            "path": self.path,
+            "tags": self.tags,
+            "state": self.state,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "queued_s": round((self.started_at or now) - self.created_at, 2),
+            "running_s": round((self.finished_at or now) - self.started_at, 2) if self.started_at else None,
+        }
+
+
+class JobQueue:
+    """
+    Background chunk -> embed -> index jobs (code.pipeline.run_pipeline) on a
+    small pool of low-priority threads. Between embedding batches a job
+    pauses (up to INGEST_YIELD_MAX_S) while busy() says interactive requests
+    are running, so uploads don't slow down /chat.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS, busy=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest",
+                                        initializer=_lower_thread_priority)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.busy = busy or (lambda: False)
+
+    def submit(self, path, tags=None):
+        job = Job(path, tags)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOBS_KEPT:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.state in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def all(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _yield_to_requests(self):
+        deadline = time.monotonic() + INGEST_YIELD_MAX_S
+        while self.busy() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _run(self, job):
+        from code.pipeline import run_pipeline
+
+        job.state = "running"
+        job.started_at = time.time()
+
+        def on_progress(stats):
+            job.progress = stats
+            self._yield_to_requests()
+
+        try:
+            job.progress = run_pipeline(job.path, on_progress=on_progress, tags=job.tags)
+            job.state = "done"
+        except Exception as e:
+            STAGE_ERRORS.inc(stage="ingest_job")
+            job.error = f"{type(e).__name__}: {e}"
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,265 @@
+# file: llm_gateway.py
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from code.concurrency import TokenBucket
+from code.tracing import LLM_EVENTS
+
+# CONFIG: upstream LLM (any OpenAI-compatible chat completions API; override via env)
+# LLM_BASE_URL wins; otherwise GROQ_BASE_URL (the Groq SDK's variable) + /openai/v1, else Groq's public API.
+# Point it at a local server (e.g. python -m code.fake_llm_server -> http://127.0.0.1:8099/v1) to run offline.
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or (os.getenv("GROQ_BASE_URL", "https://api.groq.com").rstrip("/") + "/openai/v1")
+LLM_API_KEY = os.getenv("LLM_API_KEY") or os.getenv("GROQ_API_KEY", "")
+LLM_MODEL = os.getenv("LLM_MODEL") or os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+
+# CONFIG: reliability / tail latency
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "60"))              # per call, retries included (streams: until headers)
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_STREAM_IDLE_TIMEOUT_S = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT_S", "30"))   # max gap between streamed chunks
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))              # on 429/5xx/connection errors
+LLM_RETRY_BASE_S = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))        # full-jitter backoff: U(0, base * 2^attempt)
+LLM_RETRY_MAX_S = float(os.getenv("LLM_RETRY_MAX_S", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))     # pooled keep-alive connections
+LLM_RATE_PER_S = float(os.getenv("LLM_RATE_PER_S", "0"))              # client-side request rate limit (0 = off)
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "10"))
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1") == "1"                  # identical in-flight requests share one call
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"                        # send a second copy of slow non-streamed calls
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "0"))      # 0 = observed p95 latency
+LLM_HEDGE_MIN_SAMPLES = 20                                            # latencies needed before the p95 is trusted
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The upstream call failed for good (non-retryable status, retries exhausted or deadline passed)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class _Record(SimpleNamespace):
+    """Attribute view of a JSON response; missing fields read as None (like the SDK's optional fields)."""
+
+    def __getattr__(self, name):
+        return None
+
+
+def _to_record(data):
+    if isinstance(data, dict):
+        return _Record(**{k: _to_record(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_to_record(v) for v in data]
+    return data
+
+
+def _backoff(attempt, retry_after=None):
+    delay = random.uniform(0, min(LLM_RETRY_MAX_S, LLM_RETRY_BASE_S * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+class AsyncLLMGateway:
+    """
+    OpenAI-compatible chat completions over one pooled httpx.AsyncClient.
+
+      - every call has a deadline (LLM_DEADLINE_S) that covers its retries
+      - 429/5xx/connection errors are retried with jittered exponential
+        backoff (Retry-After is honoured)
+      - a token bucket caps the request rate (LLM_RATE_PER_S)
+      - identical non-streamed requests in flight at the same time share one
+        upstream call
+      - optional hedging: a non-streamed call still running after the p95
+        latency gets a second copy and the first answer wins
+
+    Drop-in for the SDK client: gateway.chat.completions.create(model=..., messages=..., stream=...).
+    Bound to the event loop it is first used on.
+    """
+
+    def __init__(self, base_url=LLM_BASE_URL, api_key=LLM_API_KEY):
+        import httpx
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_DEADLINE_S, connect=LLM_CONNECT_TIMEOUT_S),
+        )
+        self.limiter = TokenBucket(LLM_RATE_PER_S, LLM_RATE_BURST)
+        self._in_flight = {}
+        self._latencies = deque(maxlen=500)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model=None, messages=(), stream=False, **params):
+        body = {"model": model or LLM_MODEL, "messages": list(messages), **params}
+        if stream:
+            body["stream"] = True
+            return await self._open_stream(body)
+
+        if not LLM_COALESCE:
+            return await self._complete(body)
+        key = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._complete(body))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            LLM_EVENTS.inc(event="coalesced")
+        # shield: one caller giving up must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    # ── non-streamed ──────────────────────────────
+    async def _complete(self, body):
+        if not LLM_HEDGE:
+            return await self._post_with_retries(body)
+
+        primary = asyncio.ensure_future(self._post_with_retries(body))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        LLM_EVENTS.inc(event="hedge")
+        hedge = asyncio.ensure_future(self._post_with_retries(body))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        LLM_EVENTS.inc(event="hedge_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    def hedge_delay(self):
+        if LLM_HEDGE_DELAY_MS > 0:
+            return LLM_HEDGE_DELAY_MS / 1000.0
+        if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_DEADLINE_S   # no reliable p95 yet: effectively no hedge
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    async def _post_with_retries(self, body):
+        deadline = time.monotonic() + LLM_DEADLINE_S
+        response = await self._send_with_retries(body, deadline, stream=False)
+        data = response.json()
+        return _to_record(data)
+
+    # ── streamed ──────────────────────────────────
+    async def _open_stream(self, body):
+        """Retries only cover getting the response started; once chunks flow, errors propagate."""
+        deadline = time.monotonic() + LLM_DEADLINE_S
+        response = await self._send_with_retries(body, deadline, stream=True)
+        return self._iter_stream(response)
+
+    async def _iter_stream(self, response):
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                yield _to_record(json.loads(payload))
+        finally:
+            await response.aclose()
+
+    # ── shared retry loop ─────────────────────────
+    async def _send_with_retries(self, body, deadline, stream):
+        httpx = self._httpx
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                LLM_EVENTS.inc(event="deadline")
+                raise LLMError(f"LLM call exceeded its {LLM_DEADLINE_S}s deadline")
+
+            start = time.monotonic()
+            retry_after, error = None, None
+            try:
+                timeout = httpx.Timeout(
+                    remaining, connect=min(LLM_CONNECT_TIMEOUT_S, remaining),
+                    read=LLM_STREAM_IDLE_TIMEOUT_S if stream else remaining,
+                )
+                request = self.client.build_request("POST", "chat/completions", json=body, timeout=timeout)
+                response = await asyncio.wait_for(self.client.send(request, stream=stream), timeout=remaining)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                error = LLMError(f"LLM request failed: {e!r}")
+            else:
+                if response.status_code < 400:
+                    if not stream:
+                        self._latencies.append(time.monotonic() - start)
+                    return response
+                if stream:
+                    await response.aread()
+                    await response.aclose()
+                error = LLMError(f"LLM returned {response.status_code}: {response.text[:200]}", response.status_code)
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise error
+                retry_after = _retry_after(response)
+
+            if attempt >= LLM_MAX_RETRIES:
+                raise error
+            delay = _backoff(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                raise error
+            LLM_EVENTS.inc(event="retry")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class LLMGateway:
+    """
+    Blocking front-end for the CLI / sync answering path: runs an
+    AsyncLLMGateway on a private event loop thread, so both paths share one
+    implementation. Streams come back as plain iterators.
+    """
+
+    def __init__(self, base_url=LLM_BASE_URL, api_key=LLM_API_KEY):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True).start()
+        self._gateway = self._run(self._make(base_url, api_key))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @staticmethod
+    async def _make(base_url, api_key):
+        return AsyncLLMGateway(base_url, api_key)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def create(self, model=None, messages=(), stream=False, **params):
+        result = self._run(self._gateway.create(model=model, messages=messages, stream=stream, **params))
+        return self._iter_sync(result) if stream else result
+
+    def _iter_sync(self, agen):
+        try:
+            while True:
+                try:
+                    yield self._run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(agen.aclose())
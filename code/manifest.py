@@ -0,0 +1,51 @@
+# file: manifest.py
+
+import json
+import os
+from pathlib import Path
+
+# Per-document record of what is currently indexed: chunk_id -> content_hash.
+# Lives next to the vector store because it describes the index, not the source.
+MANIFEST_DIR = Path(os.getenv("MANIFEST_DIR", "chroma_db/manifests"))
+
+
+def manifest_path(doc_id):
+    return MANIFEST_DIR / f"{doc_id}.json"
+
+
+def load_manifest(doc_id):
+    """Returns {chunk_id: content_hash} for the document, or None if it was never synced."""
+    path = manifest_path(doc_id)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))["chunks"]
+
+
+def load_manifest_tags(doc_id):
+    """Tags the document was last indexed with ([] if none / never synced)."""
+    path = manifest_path(doc_id)
+    if not path.exists():
+        return []
+    return json.loads(path.read_text(encoding="utf-8")).get("tags", [])
+
+
+def save_manifest(doc_id, source, chunk_hashes, tags=()):
+    MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+    path = manifest_path(doc_id)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps({"doc_id": doc_id, "source": source, "tags": sorted(tags), "chunks": chunk_hashes}, indent=1),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+
+
+def list_documents():
+    """[{doc_id, source, tags, chunks}] for every synced document (chunks = count)."""
+    docs = []
+    for path in sorted(MANIFEST_DIR.glob("*.json")):
+        data = json.loads(path.read_text(encoding="utf-8"))
+        docs.append({"doc_id": data["doc_id"], "source": data.get("source"),
+                     "tags": data.get("tags", []), "chunks": len(data["chunks"])})
+    return docs
+
@@ -0,0 +1,190 @@
+# file: models.py
+
+import os
+import threading
+import time
+
+# CONFIG: model and store locations (override via env)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
+COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "hackerrank_chunks")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")   # "chroma" | "numpy"
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))      # >1: split the index by doc_id, searched in parallel
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")   # "torch" | "onnx" (int8, see onnx_backend.py)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # intra-op threads for either backend; 0 = default
+# Set = embed / rerank / vector search run in a shared inference server process (see inference_server.py)
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")
+
+# ───────────────────────────────────────────────
+# Lazily initialized, process-wide resources
+# ───────────────────────────────────────────────
+# Nothing heavy happens at import time: each resource is created on first
+# use (or by warmup()) and then shared by every module in the process.
+_resources = {}
+_locks = {}
+_locks_guard = threading.Lock()
+_state = {"warm": False, "warmup_seconds": None, "warmup_error": None}
+
+
+def _get(name, factory):
+    value = _resources.get(name)
+    if value is not None:
+        return value
+    with _locks_guard:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def get_inference_client():
+    """Connection pool to the inference server(s) (only used when INFERENCE_SERVER_ADDRESS is set)."""
+    def load():
+        from code.inference_server import InferenceClient
+        return InferenceClient(INFERENCE_SERVER_ADDRESS)
+    return _get("inference_client", load)
+
+
+def _check_inference_backend():
+    if INFERENCE_BACKEND not in ("torch", "onnx"):
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {INFERENCE_BACKEND!r} (expected 'torch' or 'onnx')")
+    if INFERENCE_BACKEND == "torch" and INFERENCE_THREADS > 0:
+        import torch
+        torch.set_num_threads(INFERENCE_THREADS)
+
+
+def get_embedding_model():
+    """The one embedding model instance (SentenceTransformer or ONNX) used for both indexing and queries."""
+    def load():
+        if INFERENCE_SERVER_ADDRESS:
+            from code.inference_server import RemoteEmbedder
+            return RemoteEmbedder(get_inference_client())
+        _check_inference_backend()
+        if INFERENCE_BACKEND == "onnx":
+            from code.onnx_backend import load_onnx_embedder
+            return load_onnx_embedder(EMBEDDING_MODEL_NAME)
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _get("embedding_model", load)
+
+
+def get_reranker():
+    """(tokenizer, model) for the BGE cross-encoder reranker."""
+    def load():
+        _check_inference_backend()
+        if INFERENCE_BACKEND == "onnx":
+            from code.onnx_backend import load_onnx_reranker
+            return load_onnx_reranker(RERANKER_MODEL_NAME)
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        tokenizer = AutoTokenizer.from_pretrained(RERANKER_MODEL_NAME)
+        model = AutoModelForSequenceClassification.from_pretrained(RERANKER_MODEL_NAME)
+        model.eval()
+        return tokenizer, model
+    return _get("reranker", load)
+
+
+def get_rerank_scheduler():
+    """Cross-request batching front-end for the reranker (see rerank_batcher.py)."""
+    def load():
+        if INFERENCE_SERVER_ADDRESS:
+            from code.inference_server import RemoteRerankScheduler
+            return RemoteRerankScheduler(get_inference_client())
+        from code.rerank_batcher import RerankScheduler
+        tokenizer, model = get_reranker()
+        return RerankScheduler(tokenizer, model)
+    return _get("rerank_scheduler", load)
+
+
+def get_chroma_client():
+    def load():
+        import chromadb
+        return chromadb.PersistentClient(path=CHROMA_PATH)
+    return _get("chroma_client", load)
+
+
+def get_collection():
+    def load():
+        return get_chroma_client().get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"}  # similarity metric
+        )
+    return _get("collection", load)
+
+
+def get_vector_store():
+    """The VectorStore used by indexing and retrieval (see vector_store.py)."""
+    def load():
+        if INFERENCE_SERVER_ADDRESS:
+            from code.inference_server import RemoteVectorStore
+            return RemoteVectorStore(get_inference_client())
+        from code.vector_store import ChromaStore, NumpyStore, ShardedStore, NUMPY_STORE_PATH
+        if VECTOR_BACKEND not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND!r} (expected 'chroma' or 'numpy')")
+        if VECTOR_SHARDS <= 1:
+            return NumpyStore() if VECTOR_BACKEND == "numpy" else ChromaStore(get_collection())
+        # One collection / directory per shard: <name>_s0, <name>_s1, ...
+        if VECTOR_BACKEND == "numpy":
+            shards = [NumpyStore(path=NUMPY_STORE_PATH / f"shard{i}") for i in range(VECTOR_SHARDS)]
+        else:
+            client = get_chroma_client()
+            shards = [
+                ChromaStore(client.get_or_create_collection(name=f"{COLLECTION_NAME}_s{i}", metadata={"hnsw:space": "cosine"}))
+                for i in range(VECTOR_SHARDS)
+            ]
+        return ShardedStore(shards)
+    return _get("vector_store", load)
+
+
+def get_llm_client():
+    """Blocking LLM gateway (CLI / sync path); see llm_gateway.py for base URL, retries, rate limit."""
+    def load():
+        from code.llm_gateway import LLMGateway
+        return LLMGateway()
+    return _get("llm_client", load)
+
+
+def get_async_llm_client():
+    """Async LLM gateway for the API server (one pooled connection set, bound to the server's loop)."""
+    def load():
+        from code.llm_gateway import AsyncLLMGateway
+        return AsyncLLMGateway()
+    return _get("async_llm_client", load)
+
+
+# ───────────────────────────────────────────────
+# Warmup / readiness
+# ───────────────────────────────────────────────
+def warmup(include_store=True):
+    """
+    Load everything the request path needs and run one dummy encode + rerank
+    so lazy kernel/graph initialization happens here rather than in the
+    first real request. include_store=False leaves the vector store closed
+    (model-only inference servers).
+    """
+    start = time.perf_counter()
+    try:
+        if include_store:
+            get_vector_store().count()
+        get_embedding_model().encode(["warmup query"], convert_to_numpy=True)
+        get_rerank_scheduler().score(["warmup query [SEP] warmup passage"])
+    except Exception as e:
+        _state["warmup_error"] = repr(e)
+        raise
+    _state["warmup_seconds"] = round(time.perf_counter() - start, 2)
+    _state["warmup_error"] = None
+    _state["warm"] = True
+
+
+def is_ready():
+    return _state["warm"]
+
+
+def status():
+    return {
+        "ready": _state["warm"],
+        "loaded": sorted(_resources.keys()),
+        "warmup_seconds": _state["warmup_seconds"],
+        "warmup_error": _state["warmup_error"],
+    }
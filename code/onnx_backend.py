@@ -0,0 +1,340 @@
+# file: onnx_backend.py
+
+import json
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from code.models import INFERENCE_THREADS
+
+# CONFIG: ONNX Runtime inference (selected with INFERENCE_BACKEND=onnx in models.py)
+ONNX_CACHE_DIR = Path(os.getenv("ONNX_CACHE_DIR", "onnx_models"))    # exported/quantized models live here
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1") == "1"                # dynamic int8 weights (0 = keep FP32)
+ONNX_OPSET = 17
+
+# Requires: pip install onnxruntime onnx  (export also needs torch + transformers,
+# which the PyTorch backend already uses)
+
+
+def model_dir(model_name, kind):
+    return ONNX_CACHE_DIR / kind / model_name.strip("/").replace("/", "__")
+
+
+def session_options(threads=INFERENCE_THREADS):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+# ───────────────────────────────────────────────
+# Export (+ dynamic int8 quantization), done once per model
+# ───────────────────────────────────────────────
+def _export(model, tokenizer, out_dir, output_name):
+    """torch → ONNX with dynamic batch/sequence axes, then optional int8 quantization."""
+    import torch
+
+    class FirstOutput(torch.nn.Module):
+        """Positional inputs → first model output (last_hidden_state / logits), for tracing."""
+
+        def __init__(self, inner, names):
+            super().__init__()
+            self.inner = inner
+            self.names = names
+
+        def forward(self, *tensors):
+            return self.inner(**dict(zip(self.names, tensors)), return_dict=False)[0]
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sample = tokenizer(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"}
+
+    fp32_path = out_dir / "model.onnx"
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            FirstOutput(model, input_names),
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+
+    if ONNX_QUANTIZE:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(str(fp32_path), str(out_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(str(out_dir))
+
+
+def _onnx_path(out_dir):
+    return out_dir / ("model.int8.onnx" if ONNX_QUANTIZE else "model.onnx")
+
+
+def _pooling_mode(pooling):
+    """'cls' or 'mean' from a sentence-transformers Pooling module (old and new config layouts)."""
+    if pooling is None:
+        return "mean"
+    config = pooling.get_config_dict()
+    mode = config.get("pooling_mode") or ("cls" if config.get("pooling_mode_cls_token") else "mean")
+    if mode not in ("cls", "mean"):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {mode!r}")
+    return mode
+
+
+def export_embedder(model_name):
+    """
+    Export the SentenceTransformer's transformer body. Pooling and
+    normalization are cheap and run in NumPy, so they are recorded in
+    onnx_config.json instead of being traced into the graph.
+    """
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Pooling, Normalize
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0]
+    pooling = next((m for m in st if isinstance(m, Pooling)), None)
+    out_dir = model_dir(model_name, "embedder")
+
+    _export(transformer.auto_model, transformer.tokenizer, out_dir, "last_hidden_state")
+    config = {
+        "kind": "embedder",
+        "pooling": _pooling_mode(pooling),
+        "normalize": any(isinstance(m, Normalize) for m in st),
+        "max_length": transformer.max_seq_length,
+    }
+    (out_dir / "onnx_config.json").write_text(json.dumps(config, indent=1), encoding="utf-8")
+    return out_dir
+
+
+def export_cross_encoder(model_name):
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    out_dir = model_dir(model_name, "cross_encoder")
+
+    _export(model, tokenizer, out_dir, "logits")
+    (out_dir / "onnx_config.json").write_text(json.dumps({"kind": "cross_encoder"}, indent=1), encoding="utf-8")
+    return out_dir
+
+
+def ensure_exported(model_name, kind):
+    export_fn = {"embedder": export_embedder, "cross_encoder": export_cross_encoder}[kind]
+    out_dir = model_dir(model_name, kind)
+    if not _onnx_path(out_dir).exists() or not (out_dir / "onnx_config.json").exists():
+        print(f"Exporting {model_name} to ONNX ({'int8' if ONNX_QUANTIZE else 'fp32'}) in {out_dir} ...")
+        export_fn(model_name)
+    return out_dir
+
+
+# ───────────────────────────────────────────────
+# Runtime wrappers (drop-in for the PyTorch objects)
+# ───────────────────────────────────────────────
+class _OnnxModel:
+    def __init__(self, out_dir, threads=INFERENCE_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.path = _onnx_path(out_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(out_dir))
+        self.config = json.loads((out_dir / "onnx_config.json").read_text(encoding="utf-8"))
+        self.session = ort.InferenceSession(
+            str(self.path), sess_options=session_options(threads), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _run(self, inputs):
+        feed = {name: np.asarray(value, dtype=np.int64) for name, value in inputs.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+class OnnxEmbedder(_OnnxModel):
+    """
+    Subset of SentenceTransformer.encode() used by this repo
+    (embed_chunks, the query embedder and warmup).
+    """
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # Sort by length so each batch pads only to its own longest text
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        out = np.zeros((len(sentences), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = self.tokenizer([sentences[i] for i in idx], padding=True, truncation=True,
+                                    max_length=self.config["max_length"], return_tensors="np")
+            hidden = self._run(inputs)
+            if self.config["pooling"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = inputs["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if out.shape[1] == 0:
+                out = np.zeros((len(sentences), pooled.shape[1]), dtype=np.float32)
+            out[idx] = pooled
+
+        if self.config["normalize"] or normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """
+    Callable like the HF sequence-classification model inside
+    rerank_batcher.score_texts(): model(**inputs).logits.
+    """
+
+    return_tensors = "np"
+
+    def eval(self):
+        return self
+
+    def __call__(self, **inputs):
+        return SimpleNamespace(logits=self._run(inputs))
+
+
+def load_onnx_embedder(model_name, threads=INFERENCE_THREADS):
+    return OnnxEmbedder(ensure_exported(model_name, "embedder"), threads)
+
+
+def load_onnx_reranker(model_name, threads=INFERENCE_THREADS):
+    """(tokenizer, model) pair, same shape as models.get_reranker()."""
+    model = OnnxCrossEncoder(ensure_exported(model_name, "cross_encoder"), threads)
+    return model.tokenizer, model
+
+
+# ───────────────────────────────────────────────
+# Parity check: ONNX vs PyTorch on a sample set
+# ───────────────────────────────────────────────
+SAMPLE_QUESTIONS = [
+    "How do I reverse a linked list?",
+    "What is the time complexity of binary search?",
+    "Why does my solution get a timeout error?",
+    "How do I read input from stdin in Python?",
+    "What is dynamic programming?",
+    "How are HackerRank submissions scored?",
+    "What is the difference between a stack and a queue?",
+    "How do I fix a segmentation fault?",
+]
+
+
+def spearman(a, b):
+    """Spearman rank correlation (no tie correction; scores are continuous)."""
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    ra -= ra.mean()
+    rb -= rb.mean()
+    denom = np.sqrt((ra ** 2).sum() * (rb ** 2).sum())
+    return float((ra * rb).sum() / denom) if denom else 1.0
+
+
+def top_k_overlap(a, b, k):
+    top_a = set(np.argsort(a)[::-1][:k].tolist())
+    top_b = set(np.argsort(b)[::-1][:k].tolist())
+    return len(top_a & top_b) / max(min(k, len(a)), 1)
+
+
+def sample_passages(path="data/hackerrank_doc.txt", limit=200):
+    from code.ingest_and_chunk import iter_paragraphs
+    passages = []
+    for paragraph in iter_paragraphs(path):
+        passages.append(paragraph)
+        if len(passages) >= limit:
+            break
+    return passages
+
+
+def parity_check(embedding_model, reranker_model, passages, questions=SAMPLE_QUESTIONS, k=5):
+    """
+    Compare ONNX against the PyTorch reference:
+      - embeddings: cosine(torch, onnx) per passage, retrieval top-k overlap per question
+      - reranker: Spearman correlation and top-k overlap of scores per question
+    Returns a report dict (also includes per-backend timings).
+    """
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    from code.rerank_batcher import score_texts
+
+    report = {"passages": len(passages), "questions": len(questions), "k": k,
+              "quantized": ONNX_QUANTIZE, "threads": INFERENCE_THREADS}
+
+    # Embeddings
+    torch_embedder = SentenceTransformer(embedding_model, device="cpu")
+    onnx_embedder = load_onnx_embedder(embedding_model)
+
+    t = time.perf_counter()
+    ref_p = torch_embedder.encode(passages, convert_to_numpy=True, normalize_embeddings=True)
+    ref_q = torch_embedder.encode(questions, convert_to_numpy=True, normalize_embeddings=True)
+    report["embed_seconds_torch"] = round(time.perf_counter() - t, 3)
+    t = time.perf_counter()
+    new_p = onnx_embedder.encode(passages, normalize_embeddings=True)
+    new_q = onnx_embedder.encode(questions, normalize_embeddings=True)
+    report["embed_seconds_onnx"] = round(time.perf_counter() - t, 3)
+
+    cos = (ref_p * new_p).sum(axis=1)
+    report["embed_cosine_mean"] = round(float(cos.mean()), 4)
+    report["embed_cosine_min"] = round(float(cos.min()), 4)
+    report["retrieval_top_k_overlap"] = round(float(np.mean(
+        [top_k_overlap(ref_p @ rq, new_p @ nq, k) for rq, nq in zip(ref_q, new_q)])), 4)
+
+    # Reranker: score each question against its dense top candidates (what production reranks)
+    ref_tok = AutoTokenizer.from_pretrained(reranker_model)
+    ref_model = AutoModelForSequenceClassification.from_pretrained(reranker_model).eval()
+    onnx_tok, onnx_model = load_onnx_reranker(reranker_model)
+
+    rhos, overlaps, torch_s, onnx_s = [], [], 0.0, 0.0
+    for q, rq in zip(questions, ref_q):
+        candidates = np.argsort(ref_p @ rq)[::-1][:20]
+        texts = [q + " [SEP] " + passages[i] for i in candidates]
+        t = time.perf_counter()
+        ref_scores = np.array(score_texts(ref_tok, ref_model, texts))
+        torch_s += time.perf_counter() - t
+        t = time.perf_counter()
+        new_scores = np.array(score_texts(onnx_tok, onnx_model, texts))
+        onnx_s += time.perf_counter() - t
+        rhos.append(spearman(ref_scores, new_scores))
+        overlaps.append(top_k_overlap(ref_scores, new_scores, k))
+
+    report["rerank_spearman_mean"] = round(float(np.mean(rhos)), 4)
+    report["rerank_spearman_min"] = round(float(np.min(rhos)), 4)
+    report["rerank_top_k_overlap"] = round(float(np.mean(overlaps)), 4)
+    report["rerank_seconds_torch"] = round(torch_s, 3)
+    report["rerank_seconds_onnx"] = round(onnx_s, 3)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from code.models import EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export models to ONNX and check parity with PyTorch.")
+    parser.add_argument("--export-only", action="store_true", help="export/quantize and exit")
+    parser.add_argument("--doc", default="data/hackerrank_doc.txt", help="sample passages come from this document")
+    parser.add_argument("--passages", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    ensure_exported(EMBEDDING_MODEL_NAME, "embedder")
+    ensure_exported(RERANKER_MODEL_NAME, "cross_encoder")
+    if not args.export_only:
+        result = parity_check(EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME,
+                              sample_passages(args.doc, args.passages), k=args.k)
+        print(json.dumps(result, indent=2))
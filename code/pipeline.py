@@ -0,0 +1,141 @@
+# file: pipeline.py
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from code.ingest_and_chunk import iter_document_chunks
+from code.embed_chunks import embed_chunks
+from code.index_chroma import upsert_chunks, delete_from_chroma, indexed_state, reuse_embeddings, commit_index_changes
+from code.manifest import save_manifest, load_manifest_tags
+from code.tracing import stage_summary
+
+# CONFIG: batch sizes for the streaming pipeline (override via env or CLI flags)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))     # chunks per model.encode call
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))    # chunks per Chroma upsert
+
+
+def batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_pipeline(path, embed_batch_size=EMBED_BATCH_SIZE, index_batch_size=INDEX_BATCH_SIZE, on_progress=None,
+                 tags=None):
+    """
+    End-to-end streaming ingestion for one document:
+
+        read → split → chunk → embed (fixed-size batches) → index (batches)
+
+    Only a few batches are alive at any time, so peak memory does not grow
+    with corpus size. Writing a batch to Chroma runs on a background thread
+    while the next batch is being embedded; at most one write is in flight.
+
+    Incremental like sync_document(): chunks already indexed (same
+    content-addressed ID) are skipped, moved text reuses its stored vector,
+    and chunks no longer in the source are deleted at the end.
+
+    tags: labels for document-scoped search (None = keep the tags of the
+    last sync). Changing them re-writes every chunk's metadata, reusing the
+    stored vectors.
+
+    on_progress(stats) is called after every embedded batch.
+    Returns a stats dict.
+    """
+    start = time.perf_counter()
+    doc_id = Path(path).stem
+    old_state = indexed_state(doc_id)
+    current = {}   # chunk_id -> content_hash, becomes the new manifest
+
+    old_tags = load_manifest_tags(doc_id)
+    tags = sorted(set(old_tags if tags is None else tags))
+    tag_flags = {**{name: False for name in old_tags}, **{name: True for name in tags}}
+    # New tags -> every chunk needs its metadata rewritten (embeddings come from the store)
+    skip_state = old_state if tags == sorted(old_tags) else {}
+
+    stats = {
+        "doc_id": doc_id, "total": 0, "unchanged": 0, "upserted": 0,
+        "embedded": 0, "deleted": 0, "tokens": 0, "seconds": 0.0,
+    }
+    chunking = {}
+
+    def new_chunks():
+        for chunk in iter_document_chunks(path, stats=chunking):
+            current[chunk["chunk_id"]] = chunk["content_hash"]
+            stats["total"] += 1
+            if chunk["chunk_id"] in skip_state:
+                stats["unchanged"] += 1
+                continue
+            chunk["tags"] = tag_flags
+            yield chunk
+
+    pending_write = None
+    index_buffer = []
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-writer") as writer:
+        def flush(chunks):
+            nonlocal pending_write
+            # Wait for the previous write before queueing the next one (bounded memory)
+            if pending_write is not None:
+                pending_write.result()
+            pending_write = writer.submit(upsert_chunks, chunks)
+            stats["upserted"] += len(chunks)
+
+        for batch in batched(new_chunks(), embed_batch_size):
+            to_embed = reuse_embeddings(batch, old_state)
+            if to_embed:
+                embed_chunks(to_embed, show_progress_bar=False, batch_size=embed_batch_size)
+            stats["embedded"] += len(to_embed)
+
+            index_buffer.extend(batch)
+            while len(index_buffer) >= index_batch_size:
+                flush(index_buffer[:index_batch_size])
+                index_buffer = index_buffer[index_batch_size:]
+
+            if on_progress:
+                on_progress(dict(stats))
+
+        if index_buffer:
+            flush(index_buffer)
+        if pending_write is not None:
+            pending_write.result()
+
+    removed_ids = [cid for cid in old_state if cid not in current]
+    delete_from_chroma(removed_ids, commit=False)
+    stats["deleted"] = len(removed_ids)
+
+    if stats["upserted"] or removed_ids:
+        # One commit for the whole sync: persist BM25 + invalidate answer caches
+        # that depend on the old index contents (a single index-version bump)
+        commit_index_changes()
+    # Only record the document as synced once the index holds it; if the commit
+    # raised, the next run sees the old manifest and redoes the work
+    save_manifest(doc_id, str(path), current, tags)
+
+    stats["tokens"] = chunking.get("tokens", 0)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    if on_progress:
+        on_progress(dict(stats))
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming ingest → embed → index for one or more documents.")
+    parser.add_argument("paths", nargs="+", help="text documents to ingest")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--index-batch-size", type=int, default=INDEX_BATCH_SIZE)
+    parser.add_argument("--tag", action="append", dest="tags",
+                        help="tag the documents for scoped search (repeatable; omit to keep existing tags)")
+    args = parser.parse_args()
+
+    for doc_path in args.paths:
+        result = run_pipeline(doc_path, args.embed_batch_size, args.index_batch_size, tags=args.tags)
+        print(f"Ingested {doc_path}: {result}")
+    print(f"Stage timings: {stage_summary()}")
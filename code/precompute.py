@@ -0,0 +1,310 @@
+# file: precompute.py
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from code.index_version import get_index_version
+
+# CONFIG: precomputed answers for frequent questions (override via env)
+PRECOMPUTED_ANSWERS = os.getenv("PRECOMPUTED_ANSWERS", "1") == "1"     # 0 = never look them up
+PRECOMPUTE_DB_PATH = os.getenv("PRECOMPUTE_DB_PATH", "precomputed.db")
+QUESTION_LOG_PATH = os.getenv("QUESTION_LOG_PATH", "")                 # JSONL of asked questions, for mining (unset = off)
+
+# Precomputed answers are only served to requests they were built for:
+# no chat history, no system prompt, no doc/tag scope (see answer_with_provenance).
+#
+# Each entry records the chunk IDs its answer was built from and the index
+# version at build time. Chunk IDs are content-addressed, so an edited
+# paragraph means its old ID is deleted: delete_from_chroma() marks every
+# entry depending on a deleted ID stale. An entry looked up under a newer
+# index version is also re-checked once (its chunk IDs must all still exist),
+# which catches stores rebuilt without going through delete_from_chroma().
+# Stale entries are recomputed by `python -m code.precompute --refresh`.
+
+
+def normalize_question(text):
+    """Lookup key: case-, Unicode-width-, punctuation- and whitespace-insensitive."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _key(question, mode, show_citations):
+    return f"{mode}\x00{int(bool(show_citations))}\x00{normalize_question(question)}"
+
+
+def answer_chunk_ids(result):
+    """Source chunk IDs behind an answer (packed chunks list the IDs they were merged from)."""
+    ids = []
+    for chunk in result.get("chunks", []):
+        for chunk_id in chunk.get("ids") or [chunk["id"]]:
+            if chunk_id not in ids:
+                ids.append(chunk_id)
+    return ids
+
+
+class PrecomputedAnswers:
+    """SQLite file of answers keyed by (mode, citations, normalized question); shared by every worker."""
+
+    def __init__(self, path=PRECOMPUTE_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, question TEXT NOT NULL, mode TEXT NOT NULL, show_citations INTEGER NOT NULL,"
+                " result TEXT NOT NULL, chunk_ids TEXT NOT NULL, index_version TEXT NOT NULL,"
+                " stale INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answer_chunks (chunk_id TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (chunk_id, key))"
+            )
+
+    def lookup(self, question, mode, show_citations):
+        """The stored result dict, or None (unknown, stale, or a source chunk no longer indexed)."""
+        key = _key(question, mode, show_citations)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, chunk_ids, index_version FROM answers WHERE key = ? AND stale = 0", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        result, chunk_ids, built_at = row
+        version = get_index_version()
+        if built_at != version:
+            if not self._chunks_still_indexed(json.loads(chunk_ids)):
+                self._mark_stale([key])
+                return None
+            with self._lock, self._conn:
+                self._conn.execute("UPDATE answers SET index_version = ? WHERE key = ?", (version, key))
+        return json.loads(result)
+
+    @staticmethod
+    def _chunks_still_indexed(chunk_ids):
+        from code.models import get_vector_store
+        found = get_vector_store().get(ids=chunk_ids, include=["metadatas"])
+        return set(found["ids"]) >= set(chunk_ids)
+
+    def put(self, question, mode, show_citations, result, index_version=None):
+        key = _key(question, mode, show_citations)
+        chunk_ids = answer_chunk_ids(result)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answer_chunks WHERE key = ?", (key,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, mode, show_citations, result, chunk_ids,"
+                " index_version, stale, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (key, question, mode, int(bool(show_citations)), json.dumps(result, default=float),
+                 json.dumps(chunk_ids), index_version or get_index_version(), time.time()),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO answer_chunks (chunk_id, key) VALUES (?, ?)", [(cid, key) for cid in chunk_ids]
+            )
+
+    def remove(self, question, mode, show_citations):
+        key = _key(question, mode, show_citations)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answer_chunks WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def _mark_stale(self, keys):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE answers SET stale = 1 WHERE key = ?", [(k,) for k in keys])
+
+    def invalidate_chunks(self, chunk_ids):
+        """Mark stale every answer built from any of these chunks; returns how many."""
+        chunk_ids = list(chunk_ids)
+        keys = set()
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500):   # stay under SQLite's bound-parameter limit
+                part = chunk_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key FROM answer_chunks WHERE chunk_id IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                keys.update(k for (k,) in rows)
+        if keys:
+            self._mark_stale(keys)
+        return len(keys)
+
+    def stale_entries(self):
+        """[(question, mode, show_citations)] waiting to be recomputed."""
+        with self._lock:
+            rows = self._conn.execute("SELECT question, mode, show_citations FROM answers WHERE stale = 1").fetchall()
+        return [(q, m, bool(c)) for q, m, c in rows]
+
+    def stats(self):
+        with self._lock:
+            total, stale = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(stale), 0) FROM answers").fetchone()
+        return {"entries": total, "stale": stale}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_precomputed_store(create=False):
+    """
+    The shared PrecomputedAnswers, or None while no precompute job has written
+    the file yet (request-time lookups never create it).
+    """
+    global _store
+    if _store is None:
+        if not create and not os.path.exists(PRECOMPUTE_DB_PATH):
+            return None
+        with _store_lock:
+            if _store is None:
+                _store = PrecomputedAnswers()
+    return _store
+
+
+def lookup_precomputed(question, mode, show_citations):
+    if not PRECOMPUTED_ANSWERS:
+        return None
+    store = get_precomputed_store()
+    return store.lookup(question, mode, show_citations) if store is not None else None
+
+
+def invalidate_precomputed(chunk_ids):
+    """Called by index_chroma when chunks leave the index."""
+    store = get_precomputed_store()
+    return store.invalidate_chunks(chunk_ids) if store is not None and chunk_ids else 0
+
+
+# ───────────────────────────────────────────────
+# Traffic log + mining
+# ───────────────────────────────────────────────
+_log_lock = threading.Lock()
+
+
+def log_question(question, mode):
+    """Append an answered question to QUESTION_LOG_PATH (no-op when unset)."""
+    if not QUESTION_LOG_PATH:
+        return
+    line = json.dumps({"ts": time.time(), "question": question, "mode": mode}, ensure_ascii=False) + "\n"
+    with _log_lock, open(QUESTION_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def mine_questions(log_paths=(), session_db=None, min_count=2, top=200):
+    """
+    Most frequent questions (by normalized text) in question logs (JSONL with
+    a "question" field, e.g. QUESTION_LOG_PATH or batch_answer output) and/or
+    a SQLite session store. Returns the most common wording of each, most asked first.
+    """
+    counts, wordings = Counter(), {}
+
+    def add(question):
+        norm = normalize_question(question)
+        if norm:
+            counts[norm] += 1
+            wordings.setdefault(norm, Counter())[question.strip()] += 1
+
+    for path in log_paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                question = record.get("question") if isinstance(record, dict) else record
+                if isinstance(question, str):
+                    add(question)
+    if session_db:
+        conn = sqlite3.connect(session_db)
+        try:
+            for (turns,) in conn.execute("SELECT turns FROM sessions"):
+                for turn in json.loads(turns):
+                    add(turn.get("question") or "")
+        finally:
+            conn.close()
+
+    return [wordings[norm].most_common(1)[0][0] for norm, n in counts.most_common(top) if n >= min_count]
+
+
+# ───────────────────────────────────────────────
+# Offline job
+# ───────────────────────────────────────────────
+def precompute(questions, mode="strict", show_citations=True, **batch_options):
+    """
+    Retrieve + answer `questions` in bulk (batch_answer) and store each
+    answer with the chunk IDs and index version it was built from. Answers
+    without source chunks (e.g. the strict-mode "no information" reply) are
+    not stored, and drop any earlier entry for the question.
+    Returns {"stored", "skipped", "failed"}.
+    """
+    from code.batch_answer import answer_batch
+
+    store = get_precomputed_store(create=True)
+    version = get_index_version()
+    counts = {"stored": 0, "skipped": 0, "failed": 0}
+
+    def on_answer(item, result):
+        if result is None:
+            counts["failed"] += 1
+        elif not result.get("chunks"):
+            store.remove(item["question"], mode, show_citations)
+            counts["skipped"] += 1
+        else:
+            store.put(item["question"], mode, show_citations, result, version)
+            counts["stored"] += 1
+
+    items = [{"id": str(i), "question": q} for i, q in enumerate(questions)]
+    asyncio.run(answer_batch(items, mode=mode, show_citations=show_citations, on_answer=on_answer,
+                             use_precomputed=False, **batch_options))
+    return counts
+
+
+def main():
+    import argparse
+    from code.batch_answer import read_questions, BATCH_LLM_CONCURRENCY, BATCH_LLM_RATE_PER_S
+    from code.session_store import SESSION_DB_PATH
+
+    parser = argparse.ArgumentParser(description="Precompute answers for frequent questions (served before any model work).")
+    parser.add_argument("--questions", action="append", default=[], help="JSONL or text file, one question per line (repeatable)")
+    parser.add_argument("--from-log", action="append", default=[], help="question log to mine (JSONL with \"question\"; repeatable)")
+    parser.add_argument("--from-sessions", nargs="?", const=SESSION_DB_PATH, help="mine a SQLite session store")
+    parser.add_argument("--min-count", type=int, default=2, help="mined questions asked fewer times are skipped")
+    parser.add_argument("--top", type=int, default=200, help="at most this many mined questions")
+    parser.add_argument("--refresh", action="store_true", help="recompute entries invalidated by re-indexing")
+    parser.add_argument("--mode", choices=["strict", "hybrid"], default="strict")
+    parser.add_argument("--no-citations", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=BATCH_LLM_RATE_PER_S, help="LLM calls per second (0 = no limit)")
+    args = parser.parse_args()
+
+    questions = []
+    for path in args.questions:
+        if path.endswith(".jsonl"):
+            questions += [item["question"] for item in read_questions(path)]
+        else:
+            with open(path, encoding="utf-8") as f:
+                questions += [line.strip() for line in f if line.strip()]
+    if args.from_log or args.from_sessions:
+        questions += mine_questions(args.from_log, args.from_sessions, args.min_count, args.top)
+
+    # One job per (mode, citations): the CLI flags for new questions, the stored ones for stale entries
+    jobs = {(args.mode, not args.no_citations): questions}
+    if args.refresh:
+        for question, mode, cites in get_precomputed_store(create=True).stale_entries():
+            jobs.setdefault((mode, cites), []).append(question)
+
+    for (mode, cites), qs in jobs.items():
+        unique = list({normalize_question(q): q for q in qs}.values())
+        if not unique:
+            continue
+        start = time.perf_counter()
+        counts = precompute(unique, mode=mode, show_citations=cites, concurrency=args.concurrency, rate_per_s=args.rate)
+        print(f"✅ {mode}{'' if cites else ' (no citations)'}: {counts} in {time.perf_counter() - start:.1f}s")
+    print(f"{PRECOMPUTE_DB_PATH}: {get_precomputed_store(create=True).stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# file: rerank_batcher.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+# CONFIG: cross-request batching for the reranker (override via env)
+RERANK_BATCH_WINDOW_MS = float(os.getenv("RERANK_BATCH_WINDOW_MS", "5"))   # how long to collect pairs; 0 = no batching
+RERANK_MAX_BATCH_PAIRS = int(os.getenv("RERANK_MAX_BATCH_PAIRS", "256"))   # stop collecting once this many pairs wait
+RERANK_BUCKET_SIZE = int(os.getenv("RERANK_BUCKET_SIZE", "32"))            # pairs per forward pass
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))             # explicit truncation length
+
+
+def score_texts(tokenizer, model, texts, max_length=RERANK_MAX_LENGTH, bucket_size=RERANK_BUCKET_SIZE):
+    """
+    Score reranker inputs with as little padding as possible:
+    tokenize once, sort by token length, and run fixed-size buckets of
+    similar length so each forward pass only pads to its own longest item.
+    Returns scores in the same order as `texts`.
+
+    `model` is the HF PyTorch model or an onnx_backend.OnnxCrossEncoder
+    (which asks for NumPy inputs via its return_tensors attribute).
+    """
+    if not texts:
+        return []
+
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+
+    return_tensors = getattr(model, "return_tensors", "pt")
+    if return_tensors == "pt":
+        import torch   # only the PyTorch backend needs it; ONNX runs without torch installed
+
+        no_grad = torch.no_grad
+    else:
+        no_grad = nullcontext
+    scores = [0.0] * len(texts)
+    for start in range(0, len(order), bucket_size):
+        bucket = order[start:start + bucket_size]
+        features = {key: [encoded[key][i] for i in bucket] for key in encoded.keys()}
+        inputs = tokenizer.pad(features, padding=True, return_tensors=return_tensors)
+        with no_grad():
+            logits = model(**inputs).logits.reshape(-1)
+        for i, score in zip(bucket, logits.tolist()):
+            scores[i] = score
+    return scores
+
+
+class RerankScheduler:
+    """
+    Collects reranker inputs from concurrent requests for a short window
+    and scores them as one length-bucketed batch on a single worker thread,
+    then hands each caller back its own scores.
+
+    Callers block in score() (they already run on retrieval executor threads).
+    """
+
+    def __init__(self, tokenizer, model, window_ms=RERANK_BATCH_WINDOW_MS, max_batch_pairs=RERANK_MAX_BATCH_PAIRS):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.window_s = window_ms / 1000.0
+        self.max_batch_pairs = max_batch_pairs
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="rerank-batcher", daemon=True)
+                self._thread.start()
+
+    def score(self, texts):
+        if not texts:
+            return []
+        if self.window_s <= 0:
+            return score_texts(self.tokenizer, self.model, texts)
+
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((texts, fut))
+        return fut.result()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        n_pairs = len(first[0])
+        deadline = time.monotonic() + self.window_s
+
+        while n_pairs < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_pairs += len(item[0])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            flat = [text for texts, _ in batch for text in texts]
+            try:
+                scores = score_texts(self.tokenizer, self.model, flat)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            # Scatter scores back to each waiting request
+            offset = 0
+            for texts, fut in batch:
+                fut.set_result(scores[offset:offset + len(texts)])
+                offset += len(texts)
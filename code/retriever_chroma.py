@@ -1,30 +1,104 @@
 # file: retriever_chroma.py
 
-import chromadb
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
+import json
+import os
+import numpy as np
+from code.models import get_vector_store, get_embedding_model, get_rerank_scheduler
+from code.cache import TTLCache, normalize_text
+from code.bm25 import get_bm25_index, reciprocal_rank_fusion
+from code.index_version import get_index_version
+from code.tracing import span, traced, record_count
+
+# CONFIG: query embedding cache (override via env)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "4096"))
+QUERY_EMBED_CACHE_TTL_S = float(os.getenv("QUERY_EMBED_CACHE_TTL_S", "3600"))
+
+# CONFIG: candidate budgets for hybrid (dense + BM25) retrieval
+DENSE_N_RESULTS = int(os.getenv("DENSE_N_RESULTS", "10"))      # Chroma hits per expanded query
+LEXICAL_N_RESULTS = int(os.getenv("LEXICAL_N_RESULTS", "10"))  # BM25 hits
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # fused candidates kept before the diversity stage
+RRF_K = int(os.getenv("RRF_K", "60"))                          # reciprocal-rank-fusion constant
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"         # 0 = dense only
+
+# CONFIG: diversity stage between fusion and the reranker (near-duplicate collapse + MMR)
+DIVERSE_CANDIDATES = int(os.getenv("DIVERSE_CANDIDATES", "10"))  # pairs sent to the reranker (0 = no pruning)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))               # 1 = pure relevance, 0 = pure diversity
+NEAR_DUP_SIM = float(os.getenv("NEAR_DUP_SIM", "0.95"))          # candidates this similar to a kept one are dropped
+
+# CONFIG: adaptive query expansion. The plain question is searched first; the
+# template expansions are only added when retrieval looks weak.
+NUM_EXPANSIONS = int(os.getenv("NUM_EXPANSIONS", "3"))                        # incl. the plain question
+EXPANSION_SIM_THRESHOLD = float(os.getenv("EXPANSION_SIM_THRESHOLD", "0.5"))  # expand if top cosine sim is below
+# Optional second gate on the top reranker score (unset = off; it costs a second rerank of the new candidates)
+EXPANSION_RERANK_THRESHOLD = os.getenv("EXPANSION_RERANK_THRESHOLD")
+EXPANSION_RERANK_THRESHOLD = float(EXPANSION_RERANK_THRESHOLD) if EXPANSION_RERANK_THRESHOLD else None
+
+# Vector store (Chroma or NumPy), MPNet embedding model (same as indexing) and
+# the BGE reranker are loaded lazily from the shared registry in code/models.py.
+
+# Query text -> embedding; popular questions (and their expansions) skip the encoder
+query_embedding_cache = TTLCache(max_size=QUERY_EMBED_CACHE_SIZE, ttl_s=QUERY_EMBED_CACHE_TTL_S)
+
+# (filter, index version) -> chunk IDs in scope, so BM25 can honour document/tag filters
+scope_cache = TTLCache(max_size=256, ttl_s=QUERY_EMBED_CACHE_TTL_S)
 
-# ───────────────────────────────────────────────
-# 1. Load Chroma Client
-# ───────────────────────────────────────────────
-client = chromadb.PersistentClient(path="chroma_db")
-collection = client.get_or_create_collection(
-    name="hackerrank_chunks",
-    metadata={"hnsw:space": "cosine"}
-)
 
 # ───────────────────────────────────────────────
-# 2. Load Embedding Model (Same as indexing)
+# Document / tag scoping
 # ───────────────────────────────────────────────
-embedding_model = SentenceTransformer("all-mpnet-base-v2")
+def build_where(doc_ids=None, tags=None):
+    """
+    Metadata pre-filter for the vector store: chunks from any of `doc_ids`
+    AND carrying any of `tags` (tags are stored as "tag:<name>": True).
+    None when nothing is filtered.
+    """
+    clauses = []
+    if doc_ids:
+        doc_ids = list(doc_ids)
+        clauses.append({"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": doc_ids}})
+    if tags:
+        tag_clauses = [{f"tag:{t}": True} for t in tags]
+        clauses.append(tag_clauses[0] if len(tag_clauses) == 1 else {"$or": tag_clauses})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def scope_ids(where):
+    """Set of chunk IDs matching `where` (None = everything), cached per index version."""
+    if not where:
+        return None
+    key = (json.dumps(where, sort_keys=True), get_index_version())
+    ids = scope_cache.get(key)
+    if ids is None:
+        with span("scope_ids"):
+            ids = frozenset(get_vector_store().get(where=where, include=[])["ids"])
+        scope_cache.put(key, ids)
+    return ids
 
 
 # ───────────────────────────────────────────────
-# 3. Load Free Reranker Model
+# Cached query embedding
 # ───────────────────────────────────────────────
-tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-reranker-base")
-reranker = AutoModelForSequenceClassification.from_pretrained("BAAI/bge-reranker-base")
+def embed_queries(queries):
+    """
+    Embed query strings, serving repeats from the cache.
+    Keys are normalized text (case/whitespace-insensitive) and the normalized
+    text is what gets encoded, so cached and fresh vectors are identical.
+    Cache misses are encoded together in one batch.
+    """
+    keys = [normalize_text(q) for q in queries]
+    vectors = [query_embedding_cache.get(k) for k in keys]
+
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        with span("embed_query"):
+            encoded = get_embedding_model().encode([keys[i] for i in missing], convert_to_numpy=True)
+        for i, vec in zip(missing, encoded):
+            vec = vec.astype(np.float32)
+            query_embedding_cache.put(keys[i], vec)
+            vectors[i] = vec
+    return vectors
 
 
 # ───────────────────────────────────────────────
@@ -47,9 +121,10 @@ def expand_question(question, num_expansions=3):
 # ───────────────────────────────────────────────
 # Rerank retrieved chunks using BGE reranker
 # ───────────────────────────────────────────────
-def rerank(question, retrieved_docs):
+def rerank_with_scores(question, retrieved_docs):
     """
-    Takes a list of retrieved docs and sorts them by relevance score.
+    Scores retrieved docs with the reranker.
+    Returns [(score, doc)] sorted by relevance (descending).
     """
 
     if len(retrieved_docs) == 0:
@@ -59,58 +134,301 @@ def rerank(question, retrieved_docs):
 
     # Prepare input to the reranker
     texts = [q + " [SEP] " + d for q, d in pairs]
-    inputs = tokenizer(
-        texts, padding=True, truncation=True, return_tensors="pt"
-    )
 
-    with torch.no_grad():
-        scores = reranker(**inputs).logits.squeeze()
+    # Scored together with other in-flight requests, length-bucketed, explicit max_length
+    with span("rerank"):
+        scores = get_rerank_scheduler().score(texts)
+
+    # Pair scores with docs, sort by relevance (descending)
+    return sorted(zip(scores, retrieved_docs), key=lambda x: x[0], reverse=True)
 
-    # Pair scores with docs
-    scored_docs = list(zip(scores.tolist(), retrieved_docs))
 
-    # Sort by relevance (descending)
-    ranked = sorted(scored_docs, key=lambda x: x[0], reverse=True)
+def rerank(question, retrieved_docs):
+    """
+    Takes a list of retrieved docs and sorts them by relevance score.
+    """
+    return [doc for score, doc in rerank_with_scores(question, retrieved_docs)]
+
 
-    return [doc for score, doc in ranked]
+# ───────────────────────────────────────────────
+# Lexical (BM25) candidates
+# ───────────────────────────────────────────────
+@traced("lexical_search")
+def lexical_search(question, docs_by_id, k=LEXICAL_N_RESULTS, where=None):
+    """
+    BM25 top-k chunk IDs for the question (within the `where` scope). Text/metadata
+    for hits the dense search didn't already return are fetched from the
+    vector store in one call and added to docs_by_id.
+    """
+    hit_ids = [chunk_id for chunk_id, _ in get_bm25_index().search(question, k, allowed=scope_ids(where))]
+    missing = [chunk_id for chunk_id in hit_ids if chunk_id not in docs_by_id]
+    if missing:
+        fetched = get_vector_store().get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, text, meta in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            docs_by_id[chunk_id] = {"id": chunk_id, "text": text, "metadata": meta}
+    return [chunk_id for chunk_id in hit_ids if chunk_id in docs_by_id]
 
 
 # ───────────────────────────────────────────────
-# MAIN RETRIEVAL FUNCTION
+# Dense candidates
 # ───────────────────────────────────────────────
-def retrieve_chunks(question, top_k=4):
+def dense_query(queries, docs_by_id, n_results=DENSE_N_RESULTS, where=None, vectors=None):
     """
-    Retrieve relevant chunks using Chroma + reranker.
+    One batched encode (cache-aware) and one vector-store query for all
+    `queries`, pre-filtered by `where`. Stored embeddings are only fetched
+    when a `vectors` dict is passed (chunk_id -> vector, for the diversity stage).
+    Adds hits to docs_by_id; returns (one ranked ID list per query, best cosine similarity per query).
     """
+    query_embeddings = np.stack(embed_queries(queries))
+    include = ["documents", "metadatas", "distances"] + (["embeddings"] if vectors is not None else [])
+    with span("vector_search"):
+        results = get_vector_store().query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include,
+            where=where
+        )
 
-    # 1. Expand question to improve recall
-    expanded_queries = expand_question(question)
+    ranked_lists, similarities = [], []
+    for q, (ids, docs, metas, dists) in enumerate(
+            zip(results["ids"], results["documents"], results["metadatas"], results["distances"])):
+        ranked_lists.append(list(ids))
+        for chunk_id, text, meta in zip(ids, docs, metas):
+            docs_by_id.setdefault(chunk_id, {"id": chunk_id, "text": text, "metadata": meta})
+        if vectors is not None:
+            for chunk_id, vec in zip(ids, results["embeddings"][q]):
+                vectors.setdefault(chunk_id, vec)
+        similarities.append(1.0 - float(min(dists)) if len(dists) else 0.0)
+    return ranked_lists, similarities
 
-    # 2. Embed queries
-    query_embeddings = embedding_model.encode(expanded_queries).tolist()
 
-    # 3. Query ChromaDB
-    results = collection.query(
-        query_embeddings=query_embeddings,
-        n_results=10,  # get more for reranking
-        include=["documents", "metadatas", "embeddings"]
-    )
+def dense_search(queries, docs_by_id, n_results=DENSE_N_RESULTS, where=None, vectors=None):
+    """dense_query() for the variants of one question; returns (ranked ID lists, best cosine similarity)."""
+    ranked_lists, similarities = dense_query(queries, docs_by_id, n_results, where, vectors)
+    return ranked_lists, max(similarities, default=0.0)
 
-    # 4. Flatten and dedupe results
+
+@traced("fuse")
+def fuse_candidates(ranked_lists, docs_by_id, exclude=(), budget=RERANK_CANDIDATES):
+    """Fuse rankings with RRF, dedupe by text, keep at most `budget` docs not in `exclude`."""
     seen = set()
-    retrieved_docs = []
-
-    for docs, metas in zip(results["documents"], results["metadatas"]):
-        for text, meta in zip(docs, metas):
-            if text not in seen:
-                seen.add(text)
-                retrieved_docs.append({
-                    "text": text,
-                    "metadata": meta
-                })
-
-    # 5. Rerank using BGE Reranker
-    ranked_docs = rerank(question, retrieved_docs)
-
-    # 6. Return top K
-    return ranked_docs[:top_k]
+    candidates = []
+    for chunk_id in reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+        doc = docs_by_id[chunk_id]
+        if doc["text"] in seen:
+            continue
+        seen.add(doc["text"])
+        if chunk_id in exclude:
+            continue
+        candidates.append(doc)
+        if len(candidates) >= budget:
+            break
+    return candidates
+
+
+# ───────────────────────────────────────────────
+# Diversity: near-duplicate collapse + MMR before the reranker
+# ───────────────────────────────────────────────
+def candidate_matrix(candidates, vectors):
+    """Normalized (n, dim) matrix of candidate embeddings; BM25-only hits are fetched in one call. None if any is missing."""
+    missing = [doc["id"] for doc in candidates if doc["id"] not in vectors]
+    if missing:
+        fetched = get_vector_store().get(ids=missing, include=["embeddings"])
+        for chunk_id, vec in zip(fetched["ids"], fetched["embeddings"]):
+            vectors[chunk_id] = vec
+    if any(doc["id"] not in vectors for doc in candidates):
+        return None
+    matrix = np.stack([np.asarray(vectors[doc["id"]], dtype=np.float32) for doc in candidates])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+@traced("diversify")
+def diversify_candidates(candidates, vectors, budget=DIVERSE_CANDIDATES, mmr_lambda=MMR_LAMBDA, dup_sim=NEAR_DUP_SIM):
+    """
+    Shrink fused candidates (best first) to at most `budget` diverse ones:
+
+      1. near-duplicates (cosine >= dup_sim to an already kept, better-ranked
+         candidate; e.g. overlapping windows of one paragraph) are dropped
+      2. if more than `budget` remain, maximal marginal relevance picks them:
+         relevance is the fused rank (so BM25-only hits keep their place),
+         redundancy the max cosine similarity to what is already picked
+
+    Returns (kept candidates in fused order, number pruned).
+    """
+    if budget <= 0 or len(candidates) <= 1:
+        return candidates, 0
+    matrix = candidate_matrix(candidates, vectors)
+    if matrix is None:
+        return candidates, 0
+    sims = matrix @ matrix.T
+
+    keep = []
+    for i in range(len(candidates)):
+        if keep and sims[i, keep].max() >= dup_sim:
+            continue
+        keep.append(i)
+
+    if len(keep) > budget:
+        keep = np.array(keep)
+        relevance = 1.0 - keep / len(candidates)
+        sub = sims[np.ix_(keep, keep)]
+        picked = np.zeros(len(keep), dtype=bool)
+        picked[0] = True
+        max_sim = sub[0].copy()
+        for _ in range(budget - 1):
+            mmr = mmr_lambda * relevance - (1 - mmr_lambda) * max_sim
+            mmr[picked] = -np.inf
+            j = int(np.argmax(mmr))
+            picked[j] = True
+            max_sim = np.maximum(max_sim, sub[j])
+        keep = sorted(keep[picked].tolist())
+
+    return [candidates[i] for i in keep], len(candidates) - len(keep)
+
+
+# ───────────────────────────────────────────────
+# MAIN RETRIEVAL FUNCTION
+# ───────────────────────────────────────────────
+def retrieve_chunks_with_stats(question, top_k=4, where=None):
+    """
+    Retrieve relevant chunks using the vector store + BM25 (fused with RRF) + reranker.
+    `where` (see build_where) limits every stage to some documents/tags.
+
+    Query expansion is adaptive: the plain question goes first, and the
+    expansions are only searched (in one batched encode + one query) when the
+    best dense similarity, or optionally the best reranker score, is below
+    its threshold. Fused candidates go through diversify_candidates() before
+    the reranker.
+
+    Returns (top_k docs, stats) where stats holds per-stage counts.
+    Each doc is {"id", "text", "metadata", "score"}.
+    """
+    stats = {
+        "expanded": False,
+        "dense_queries": 1,
+        "dense_hits": 0,
+        "lexical_hits": 0,
+        "rerank_candidates": 0,
+        "top_similarity": None,
+        "top_rerank_score": None,
+        "pruned_pairs": 0,
+    }
+    docs_by_id = {}
+    vectors = {} if DIVERSE_CANDIDATES > 0 else None
+    with span("expand"):
+        expansions = expand_question(question, NUM_EXPANSIONS)[1:]
+
+    # 1. Plain question against the vector store
+    ranked_lists, top_similarity = dense_search([question], docs_by_id, where=where, vectors=vectors)
+    stats["top_similarity"] = round(top_similarity, 4)
+
+    # 2. Expand only when the dense match looks weak
+    if expansions and top_similarity < EXPANSION_SIM_THRESHOLD:
+        more_lists, _ = dense_search(expansions, docs_by_id, where=where, vectors=vectors)
+        ranked_lists += more_lists
+        stats["expanded"] = True
+        stats["dense_queries"] += len(expansions)
+
+    # 3. Lexical candidates (exact keywords, problem names, error strings)
+    if HYBRID_SEARCH:
+        lexical_ids = lexical_search(question, docs_by_id, where=where)
+        ranked_lists.append(lexical_ids)
+        stats["lexical_hits"] = len(lexical_ids)
+    stats["dense_hits"] = sum(len(ids) for ids in ranked_lists[:stats["dense_queries"]])
+
+    # 4. Fuse rankings, dedupe by text, keep the reranker budget
+    candidates = fuse_candidates(ranked_lists, docs_by_id)
+
+    # 5. Drop near-duplicates, MMR down to DIVERSE_CANDIDATES
+    if vectors is not None:
+        candidates, pruned = diversify_candidates(candidates, vectors)
+        stats["pruned_pairs"] += pruned
+
+    # 6. Rerank using BGE Reranker
+    scored = rerank_with_scores(question, candidates)
+    stats["rerank_candidates"] = len(candidates)
+
+    # 7. Second chance: the reranker didn't like anything -> expand and rerank only the new candidates
+    top_score = scored[0][0] if scored else None
+    if (EXPANSION_RERANK_THRESHOLD is not None and expansions and not stats["expanded"]
+            and (top_score is None or top_score < EXPANSION_RERANK_THRESHOLD)):
+        more_lists, _ = dense_search(expansions, docs_by_id, where=where, vectors=vectors)
+        stats["expanded"] = True
+        stats["dense_queries"] += len(expansions)
+        stats["dense_hits"] += sum(len(ids) for ids in more_lists)
+        already = {doc["id"] for doc in candidates}
+        extra = fuse_candidates(ranked_lists + more_lists, docs_by_id, exclude=already)
+        if vectors is not None:
+            extra, pruned = diversify_candidates(extra, vectors)
+            stats["pruned_pairs"] += pruned
+        scored = sorted(scored + rerank_with_scores(question, extra), key=lambda x: x[0], reverse=True)
+        stats["rerank_candidates"] += len(extra)
+
+    if scored:
+        stats["top_rerank_score"] = round(float(scored[0][0]), 4)
+    for name in ("dense_hits", "lexical_hits", "rerank_candidates", "pruned_pairs"):
+        record_count(name, stats[name])
+
+    # 8. Return top K, each carrying its reranker score (raw logit, higher = more relevant)
+    return [{**doc, "score": round(float(score), 4)} for score, doc in scored[:top_k]], stats
+
+
+def retrieve_chunks(question, top_k=4, where=None):
+    """
+    Retrieve relevant chunks using the vector store + BM25 (fused with RRF) + reranker.
+    """
+    docs, _ = retrieve_chunks_with_stats(question, top_k, where)
+    return docs
+
+
+def retrieve_chunks_batch(questions, top_k=4, where=None):
+    """
+    retrieve_chunks() for many questions at once (bulk evaluation / pre-warming):
+    one batched encode + one vector-store query for all plain questions, one
+    more for the expansions of the weak ones, and a single reranker call for
+    every (question, candidate) pair (after the diversity stage). The
+    reranker-score expansion gate is not applied here. `where` applies to every question. Returns one doc list per question.
+    """
+    if not questions:
+        return []
+    docs_by_id = {}
+    vectors = {} if DIVERSE_CANDIDATES > 0 else None
+
+    # 1. All plain questions in one encode + one query
+    ranked, similarities = dense_query(questions, docs_by_id, where=where, vectors=vectors)
+    per_question = [[ranked_list] for ranked_list in ranked]
+
+    # 2. Expansions for the weak ones, again in one encode + one query
+    with span("expand"):
+        weak = [i for i, sim in enumerate(similarities) if sim < EXPANSION_SIM_THRESHOLD]
+        expansions = [(i, q) for i in weak for q in expand_question(questions[i], NUM_EXPANSIONS)[1:]]
+    if expansions:
+        more_lists, _ = dense_query([q for _, q in expansions], docs_by_id, where=where, vectors=vectors)
+        for (i, _), ranked_list in zip(expansions, more_lists):
+            per_question[i].append(ranked_list)
+
+    # 3. Lexical candidates, fuse, cap and diversify per question
+    candidates, pruned = [], 0
+    for question, ranked_lists in zip(questions, per_question):
+        if HYBRID_SEARCH:
+            ranked_lists.append(lexical_search(question, docs_by_id, where=where))
+        fused = fuse_candidates(ranked_lists, docs_by_id)
+        if vectors is not None:
+            fused, n = diversify_candidates(fused, vectors)
+            pruned += n
+        candidates.append(fused)
+    record_count("pruned_pairs", pruned)
+
+    # 4. One reranker call for every pair, scattered back per question
+    texts = [q + " [SEP] " + doc["text"] for q, docs in zip(questions, candidates) for doc in docs]
+    with span("rerank"):
+        scores = get_rerank_scheduler().score(texts)
+    record_count("rerank_candidates", len(texts))
+
+    results, offset = [], 0
+    for docs in candidates:
+        scored = sorted(zip(scores[offset:offset + len(docs)], docs), key=lambda x: x[0], reverse=True)
+        offset += len(docs)
+        results.append([{**doc, "score": round(float(score), 4)} for score, doc in scored[:top_k]])
+    return results
@@ -0,0 +1,100 @@
+# file: session_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from code.cache import TTLCache
+
+# CONFIG: server-side chat sessions keyed by session_id (override via env)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")       # "memory" | "sqlite"
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))           # memory backend: sessions kept (LRU)
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "86400"))     # idle sessions expire after this
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "50"))  # turns stored per session (oldest dropped)
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+
+class InMemorySessionStore:
+    """Sessions in this process only: LRU beyond SESSION_MAX, idle sessions expire after SESSION_TTL_S."""
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl_s=SESSION_TTL_S, max_turns=SESSION_MAX_TURNS):
+        self._cache = TTLCache(max_size=max_sessions, ttl_s=ttl_s)
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Turns [{question, answer}] oldest first ([] for unknown/expired sessions)."""
+        with self._lock:
+            return list(self._cache.get(session_id) or [])
+
+    def append(self, session_id, turn):
+        with self._lock:
+            turns = (self._cache.get(session_id) or []) + [turn]
+            self._cache.put(session_id, turns[-self.max_turns:])
+
+    def delete(self, session_id):
+        self._cache.delete(session_id)
+
+
+class SqliteSessionStore:
+    """
+    Sessions in a SQLite file, shared by every worker process on the host
+    and kept across restarts. Expired sessions are pruned on write.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, ttl_s=SESSION_TTL_S, max_turns=SESSION_MAX_TURNS):
+        self.ttl_s = ttl_s
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, turns TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_s),
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def append(self, session_id, turn):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT turns FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, now - self.ttl_s),
+            ).fetchone()
+            turns = (json.loads(row[0]) if row else []) + [turn]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, turns, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(turns[-self.max_turns:]), now),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_s,))
+
+    def delete(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_BACKEND == "sqlite":
+                _store = SqliteSessionStore()
+            elif SESSION_BACKEND == "memory":
+                _store = InMemorySessionStore()
+            else:
+                raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND!r} (expected 'memory' or 'sqlite')")
+        return _store
@@ -0,0 +1,201 @@
+# file: tracing.py
+
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# ───────────────────────────────────────────────
+# Minimal Prometheus-style metrics (text exposition format, no extra dependency)
+# ───────────────────────────────────────────────
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_registry = []
+
+
+def _labels_text(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def totals(self):
+        """{label values: (sum, count)}"""
+        with self._lock:
+            return {key: (series[-2], series[-1]) for key, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, ('le', bound))} {n}")
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def render_metrics():
+    """All metrics in Prometheus text format (served on /metrics)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent per pipeline stage", ("stage",))
+STAGE_ITEMS = Histogram("rag_stage_items", "Candidates/items handled per pipeline stage", ("stage",), COUNT_BUCKETS)
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens used", ("kind",))
+ANSWER_OUTCOMES = Counter("rag_answer_outcomes_total", "How answers were produced", ("outcome",))
+LLM_EVENTS = Counter("rag_llm_gateway_events_total", "LLM gateway retries, hedges, coalesced calls, deadlines", ("event",))
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Exceptions raised inside a stage", ("stage",))
+
+
+# ───────────────────────────────────────────────
+# Spans: time a stage, feed the histograms, and (optionally) a per-request trace
+# ───────────────────────────────────────────────
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Trace:
+    """Per-request record of stage timings/counts (for the debug_timings response field)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_count(self, name, n):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+                "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+                "counts": dict(self.counts),
+            }
+
+
+@contextmanager
+def trace():
+    """Collect every span below this point (including retrieval executor threads) into one Trace."""
+    t = Trace()
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_stage(stage, seconds):
+    """Record a stage timing measured by hand (e.g. time to first streamed token)."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    t = _current_trace.get()
+    if t is not None:
+        t.add_time(stage, seconds)
+
+
+def traced(stage):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_count(name, n):
+    STAGE_ITEMS.observe(n, stage=name)
+    t = _current_trace.get()
+    if t is not None:
+        t.add_count(name, n)
+
+
+def record_llm_usage(usage):
+    """Count prompt/completion tokens from an OpenAI-style usage object (ignored if missing)."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, kind, None)
+        if n is None and isinstance(usage, dict):
+            n = usage.get(kind)
+        if n:
+            LLM_TOKENS.inc(n, kind=kind.replace("_tokens", ""))
+            t = _current_trace.get()
+            if t is not None:
+                t.add_count(f"llm_{kind}", n)
+
+
+def stage_summary():
+    """{stage: {"calls", "total_s"}} accumulated in this process (printed by the ingestion CLIs)."""
+    return {
+        key[0]: {"calls": count, "total_s": round(total, 3)}
+        for key, (total, count) in sorted(STAGE_SECONDS.totals().items())
+    }
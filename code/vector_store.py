@@ -0,0 +1,591 @@
+# file: vector_store.py
+
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # not POSIX: flushes are not serialized across processes
+    fcntl = None
+
+# CONFIG: in-process NumPy backend (override via env)
+NUMPY_STORE_PATH = Path(os.getenv("NUMPY_STORE_PATH", "numpy_store"))
+NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32")            # float32 | float16
+NUMPY_IVF_LISTS = int(os.getenv("NUMPY_IVF_LISTS", "0"))                 # >0 enables coarse partitions
+NUMPY_IVF_NPROBE = int(os.getenv("NUMPY_IVF_NPROBE", "8"))               # partitions searched per query
+NUMPY_IVF_MIN_ROWS = int(os.getenv("NUMPY_IVF_MIN_ROWS", "50000"))       # below this, always exact
+NUMPY_MAX_PENDING_ROWS = int(os.getenv("NUMPY_MAX_PENDING_ROWS", "20000")) # buffered upserts before an early flush (0 = no limit)
+SCORE_BLOCK_ROWS = 65536                                                 # rows per matmul block (bounds float16 upcast)
+
+
+class VectorStore:
+    """
+    Minimal vector-store interface used by indexing and retrieval.
+    Result shapes follow Chroma's so callers don't care which backend runs:
+
+      query() -> {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+      get()   -> {"ids": [...], "documents": [...], "metadatas": [...], "embeddings": [...]}
+
+    Distances are cosine distances (1 - cosine similarity).
+    """
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances"), where=None):
+        raise NotImplementedError
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Make buffered writes durable/visible. No-op for backends that write through."""
+
+
+# ───────────────────────────────────────────────
+# Chroma backend
+# ───────────────────────────────────────────────
+class ChromaStore(VectorStore):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances"), where=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings, n_results=n_results, include=list(include), where=where
+        )
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        return self.collection.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset or None)
+
+    def count(self):
+        return self.collection.count()
+
+
+# ───────────────────────────────────────────────
+# Metadata filters (Chroma "where" subset) for the NumPy backend
+# ───────────────────────────────────────────────
+def matches_where(meta, where):
+    """Supports {"k": v}, {"k": {"$eq"|"$ne"|"$in"|"$nin": ...}}, {"$and": [...]}, {"$or": [...]}."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                if op == "$eq" and value != arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+# ───────────────────────────────────────────────
+# NumPy backend: memory-mapped matrix + exact / IVF search
+# ───────────────────────────────────────────────
+class _Snapshot:
+    """One consistent view of the on-disk store; replaced wholesale on reload."""
+
+    def __init__(self, embeddings, ids, documents, metadatas, centroids=None, assignments=None):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.row_of = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        self.centroids = centroids
+        self.lists = None
+        if centroids is not None:
+            self.lists = [np.flatnonzero(assignments == c) for c in range(len(centroids))]
+
+
+class NumpyStore(VectorStore):
+    """
+    Embeddings live in one normalized float32/float16 .npy matrix that every
+    process memory-maps read-only (shared page cache across API workers);
+    ids/text/metadata live in records.json. Exact top-k is one blocked
+    matrix multiply + argpartition. With NUMPY_IVF_LISTS > 0 and enough rows,
+    a k-means coarse quantizer restricts each query to NUMPY_IVF_NPROBE partitions.
+
+    Writes are buffered and applied on flush(), which writes a complete new
+    generation directory (gen-<ns>/ with embeddings.npy, records.json and
+    ivf.npz) and then switches the CURRENT pointer file with one os.replace.
+    Readers only ever load the files of a single generation, so embeddings
+    and records can't come from different flushes; they pick up a new
+    generation on their next call. Flushes from different processes take an
+    fcntl lock on the store directory and apply their changes on top of
+    whatever generation is current at that point.
+
+    Buffered upserts keep a float32 copy of each vector plus its text and
+    metadata in memory (roughly rows * (4 * dim + text size)), and a flush
+    also materializes the full float32 matrix. Once NUMPY_MAX_PENDING_ROWS
+    upserts are buffered the store flushes on its own, so a large sync costs
+    a few extra generation writes instead of unbounded memory; readers may
+    then see part of that sync before the caller's final flush.
+    """
+
+    def __init__(self, path=NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE, ivf_lists=NUMPY_IVF_LISTS,
+                 nprobe=NUMPY_IVF_NPROBE, ivf_min_rows=NUMPY_IVF_MIN_ROWS, max_pending_rows=NUMPY_MAX_PENDING_ROWS):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.max_pending_rows = max_pending_rows
+        self._lock = threading.RLock()
+        self._loaded_gen = None       # generation dir the snapshot came from
+        self._snap = _Snapshot(np.zeros((0, 0), dtype=self.dtype), [], [], [])
+        self._pending_upserts = {}   # id -> (vector, text, metadata)
+        self._pending_deletes = set()
+
+    @property
+    def _current_path(self):
+        return self.path / "CURRENT"
+
+    def _current_generation(self):
+        """Directory of the committed generation, or None if nothing was flushed yet."""
+        try:
+            # The name itself is the version (a tiny read; mtimes are too coarse to tell quick flushes apart)
+            return self.path / self._current_path.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            # Stores written before generations existed keep their files at the top level
+            return self.path if (self.path / "records.json").exists() else None
+
+    @staticmethod
+    def _load_generation(gen_dir):
+        records = json.loads((gen_dir / "records.json").read_text(encoding="utf-8"))
+        embeddings = np.load(gen_dir / "embeddings.npy", mmap_mode="r")
+        if len(embeddings) != len(records["ids"]):
+            raise ValueError(f"{gen_dir}: {len(embeddings)} embeddings for {len(records['ids'])} records")
+        centroids = assignments = None
+        if (gen_dir / "ivf.npz").exists():
+            ivf = np.load(gen_dir / "ivf.npz")
+            if len(ivf["assignments"]) == len(records["ids"]):
+                centroids, assignments = ivf["centroids"], ivf["assignments"]
+        return _Snapshot(embeddings, records["ids"], records["documents"], records["metadatas"],
+                         centroids, assignments)
+
+    def snapshot(self):
+        """Current view, re-opening the files if another process flushed a new generation."""
+        gen_dir = self._current_generation()
+        if gen_dir is None or gen_dir == self._loaded_gen:
+            return self._snap
+
+        with self._lock:
+            error = None
+            for _ in range(3):
+                gen_dir = self._current_generation()
+                if gen_dir is None or gen_dir == self._loaded_gen:
+                    return self._snap
+                try:
+                    self._snap = self._load_generation(gen_dir)
+                except (FileNotFoundError, ValueError) as e:
+                    # The generation was replaced and cleaned up while we read it: read CURRENT again
+                    error = e
+                    continue
+                self._loaded_gen = gen_dir
+                return self._snap
+            if self._loaded_gen is None:
+                raise RuntimeError(f"Could not load a consistent generation of {self.path}") from error
+            return self._snap   # keep serving the previous generation; the next call retries
+
+    @staticmethod
+    def _generation_ns(gen_dir):
+        """Creation stamp from a gen-<ns> name; the pre-generation layout sorts first."""
+        try:
+            return int(gen_dir.name[len("gen-"):]) if gen_dir.name.startswith("gen-") else -1
+        except ValueError:
+            return None
+
+    def _remove_old_generations(self, replaced):
+        """
+        Delete generations older than `replaced` (the one just superseded, which
+        readers may still be loading). Caller holds the flush lock, so anything
+        newer is the one it just wrote, never another writer's work in progress.
+        """
+        if replaced is None:
+            return
+        cutoff = self._generation_ns(replaced)
+        if cutoff is None or cutoff < 0:
+            return
+        for entry in self.path.glob("gen-*"):
+            stamp = self._generation_ns(entry)
+            if stamp is not None and stamp < cutoff:
+                shutil.rmtree(entry, ignore_errors=True)
+        for name in ("embeddings.npy", "records.json", "ivf.npz"):   # pre-generation layout
+            (self.path / name).unlink(missing_ok=True)
+
+    @contextmanager
+    def _flush_lock(self):
+        """Serializes read-merge-write of generations between processes."""
+        if fcntl is None:
+            yield
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "LOCK", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---- writes ------------------------------------------------------------
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            for chunk_id, vec, text, meta in zip(ids, vectors, documents, metadatas):
+                self._pending_deletes.discard(chunk_id)
+                self._pending_upserts[chunk_id] = (vec, text, meta)
+            if self.max_pending_rows and len(self._pending_upserts) >= self.max_pending_rows:
+                self.flush()
+
+    def delete(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                self._pending_upserts.pop(chunk_id, None)
+                self._pending_deletes.add(chunk_id)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending_upserts and not self._pending_deletes:
+                return
+            with self._flush_lock():
+                self._flush_locked()
+
+    def _flush_locked(self):
+        """Apply pending writes on top of the latest committed generation (which may be another process's)."""
+        snap = self.snapshot()
+        replaced = self._loaded_gen
+        pending = self._pending_upserts
+
+        keep = [i for i, chunk_id in enumerate(snap.ids)
+                if chunk_id not in self._pending_deletes and chunk_id not in pending]
+        new_ids = [snap.ids[i] for i in keep] + list(pending)
+        new_docs = [snap.documents[i] for i in keep] + [v[1] for v in pending.values()]
+        new_metas = [snap.metadatas[i] for i in keep] + [v[2] for v in pending.values()]
+
+        parts = []
+        if keep:
+            parts.append(np.asarray(snap.embeddings[keep], dtype=np.float32))
+        if pending:
+            added = np.stack([v[0] for v in pending.values()])
+            norms = np.linalg.norm(added, axis=1, keepdims=True)
+            parts.append(added / np.where(norms > 0, norms, 1))
+        matrix = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+        # A complete new generation first ...
+        stamp = max(time.time_ns(), (self._generation_ns(replaced) or 0) + 1) if replaced else time.time_ns()
+        gen_dir = self.path / f"gen-{stamp}"
+        gen_dir.mkdir(parents=True)
+        np.save(gen_dir / "embeddings.npy", matrix.astype(self.dtype))
+        if self.ivf_lists > 0 and len(new_ids) >= self.ivf_min_rows:
+            centroids, assignments = build_ivf(matrix, self.ivf_lists)
+            np.savez(gen_dir / "ivf.npz", centroids=centroids, assignments=assignments)
+        (gen_dir / "records.json").write_text(
+            json.dumps({"ids": new_ids, "documents": new_docs, "metadatas": new_metas}), encoding="utf-8"
+        )
+
+        # ... then readers switch to it in one step
+        tmp_current = self.path / "CURRENT.tmp"
+        tmp_current.write_text(gen_dir.name, encoding="utf-8")
+        os.replace(tmp_current, self._current_path)
+
+        self._pending_upserts = {}
+        self._pending_deletes = set()
+        self.snapshot()
+        self._remove_old_generations(replaced)
+
+    # ---- reads -------------------------------------------------------------
+    def count(self):
+        return len(self.snapshot().ids)
+
+    @staticmethod
+    def _scores(snap, queries, rows=None):
+        """Cosine similarities (n_queries, n_rows) computed block by block."""
+        n_rows = len(snap.ids) if rows is None else len(rows)
+        out = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, SCORE_BLOCK_ROWS):
+            if rows is None:
+                block = snap.embeddings[start:start + SCORE_BLOCK_ROWS]
+            else:
+                block = snap.embeddings[rows[start:start + SCORE_BLOCK_ROWS]]
+            block = np.asarray(block, dtype=np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        return out
+
+    def _candidate_rows(self, snap, query):
+        """IVF: rows in the nprobe partitions closest to the query."""
+        nprobe = min(self.nprobe, len(snap.centroids))
+        nearest = np.argpartition(-(snap.centroids @ query), nprobe - 1)[:nprobe]
+        return np.sort(np.concatenate([snap.lists[c] for c in nearest]))
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances"), where=None):
+        snap = self.snapshot()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+
+        allowed = None
+        if where:
+            allowed = np.array([i for i, meta in enumerate(snap.metadatas) if matches_where(meta, where)],
+                               dtype=np.int64)
+
+        if snap.centroids is None:
+            # Exact: one matmul for all queries
+            all_sims = self._scores(snap, queries, allowed) if len(snap.ids) else np.zeros((len(queries), 0))
+            per_query = [(sims, allowed) for sims in all_sims]
+        else:
+            per_query = []
+            for q in queries:
+                rows = self._candidate_rows(snap, q)
+                if allowed is not None:
+                    rows = np.intersect1d(rows, allowed)
+                per_query.append((self._scores(snap, q[None, :], rows)[0], rows))
+
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        for sims, rows in per_query:
+            k = min(n_results, len(sims))
+            top = np.argpartition(-sims, k - 1)[:k] if k else np.array([], dtype=np.int64)
+            top = top[np.argsort(-sims[top])]
+            hits = top if rows is None else rows[top]
+            out["ids"].append([snap.ids[r] for r in hits])
+            out["documents"].append([snap.documents[r] for r in hits])
+            out["metadatas"].append([snap.metadatas[r] for r in hits])
+            out["distances"].append((1.0 - sims[top]).tolist())
+            if "embeddings" in include:
+                out["embeddings"].append(np.asarray(snap.embeddings[hits], dtype=np.float32))
+
+        return {key: value for key, value in out.items() if key == "ids" or key in include}
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        snap = self.snapshot()
+        if ids is not None:
+            rows = [snap.row_of[chunk_id] for chunk_id in ids if chunk_id in snap.row_of]
+        else:
+            rows = list(range(len(snap.ids)))
+        if where:
+            rows = [r for r in rows if matches_where(snap.metadatas[r], where)]
+        rows = rows[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+
+        out = {"ids": [snap.ids[r] for r in rows]}
+        if "documents" in include:
+            out["documents"] = [snap.documents[r] for r in rows]
+        if "metadatas" in include:
+            out["metadatas"] = [snap.metadatas[r] for r in rows]
+        if "embeddings" in include:
+            out["embeddings"] = np.asarray(snap.embeddings[rows], dtype=np.float32) if rows else []
+        return out
+
+
+# ───────────────────────────────────────────────
+# Sharding: several stores searched in parallel
+# ───────────────────────────────────────────────
+def shard_of(metadata, n_shards):
+    """Stable shard for a chunk: all chunks of a document live in one shard."""
+    return zlib.crc32(str((metadata or {}).get("doc_id", "")).encode("utf-8")) % n_shards
+
+
+class ShardedStore(VectorStore):
+    """
+    Spreads a large corpus over several stores (Chroma collections or NumPy
+    directories). Chunks are placed by doc_id, so a document-filtered query
+    only touches the shards holding those documents. Queries run on every
+    (relevant) shard in parallel and are merged by distance.
+    """
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    def _map(self, fn, shards=None):
+        shards = self.shards if shards is None else shards
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._pool.map(fn, shards))
+
+    def _shards_for(self, where):
+        """Only the shards that can hold matches for a doc_id filter (all shards otherwise)."""
+        doc_filter = (where or {}).get("doc_id")
+        if doc_filter is None and where and "$and" in where:
+            doc_filter = next((c["doc_id"] for c in where["$and"] if "doc_id" in c), None)
+        if doc_filter is None:
+            return self.shards
+        doc_ids = doc_filter["$in"] if isinstance(doc_filter, dict) and "$in" in doc_filter else [doc_filter]
+        if not all(isinstance(d, str) for d in doc_ids):
+            return self.shards
+        wanted = {shard_of({"doc_id": d}, len(self.shards)) for d in doc_ids}
+        return [shard for i, shard in enumerate(self.shards) if i in wanted]
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        groups = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(shard_of(meta, len(self.shards)), []).append(i)
+        for shard_idx, rows in groups.items():
+            self.shards[shard_idx].upsert(
+                [ids[i] for i in rows], np.asarray(embeddings)[rows],
+                [documents[i] for i in rows], [metadatas[i] for i in rows],
+            )
+
+    def delete(self, ids):
+        ids = list(ids)
+        self._map(lambda shard: shard.delete(ids))
+
+    def flush(self):
+        self._map(lambda shard: shard.flush())
+
+    def count(self):
+        return sum(self._map(lambda shard: shard.count()))
+
+    def query(self, query_embeddings, n_results=10, include=("documents", "metadatas", "distances"), where=None):
+        include = list(include)
+        fields = [f for f in ("documents", "metadatas", "embeddings") if f in include]
+        shard_include = include if "distances" in include else include + ["distances"]
+        results = self._map(
+            lambda shard: shard.query(query_embeddings, n_results=n_results, include=shard_include, where=where),
+            self._shards_for(where),
+        )
+
+        out = {key: [] for key in ["ids"] + [k for k in include if k in ("documents", "metadatas", "distances", "embeddings")]}
+        for q in range(len(query_embeddings)):
+            hits = []
+            for res in results:
+                for j, chunk_id in enumerate(res["ids"][q]):
+                    hits.append((res["distances"][q][j], chunk_id, {f: res[f][q][j] for f in fields}))
+            hits.sort(key=lambda h: h[0])
+            hits = hits[:n_results]
+            out["ids"].append([h[1] for h in hits])
+            if "distances" in out:
+                out["distances"].append([float(h[0]) for h in hits])
+            for f in fields:
+                values = [h[2][f] for h in hits]
+                out[f].append(np.asarray(values, dtype=np.float32) if f == "embeddings" else values)
+        return out
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        include = list(include)
+        shards = self._shards_for(where)
+        if ids is None and limit is not None and not where:
+            # Paging without a filter: skip whole shards by their counts instead of fetching them
+            counts = self._map(lambda shard: shard.count(), shards)
+            parts, skip, wanted = [], offset or 0, limit
+            for shard, n in zip(shards, counts):
+                if skip >= n:
+                    skip -= n
+                    continue
+                page = shard.get(include=include, limit=wanted, offset=skip)
+                parts.append(page)
+                wanted -= len(page["ids"])
+                skip = 0
+                if wanted <= 0:
+                    break
+        else:
+            parts = self._map(lambda shard: shard.get(ids=ids, where=where, include=include), shards)
+            if limit is not None or offset:
+                parts = [_slice_page(_concat_pages(parts, include), offset or 0, limit)]
+        return _concat_pages(parts, include)
+
+
+def _concat_pages(pages, include):
+    out = {"ids": [chunk_id for page in pages for chunk_id in page["ids"]]}
+    for f in ("documents", "metadatas"):
+        if f in include:
+            out[f] = [value for page in pages for value in page[f]]
+    if "embeddings" in include:
+        vectors = [np.asarray(page["embeddings"], dtype=np.float32) for page in pages if len(page["ids"])]
+        out["embeddings"] = np.concatenate(vectors) if vectors else []
+    return out
+
+
+def _slice_page(page, offset, limit):
+    end = None if limit is None else offset + limit
+    return {key: value[offset:end] for key, value in page.items()}
+
+
+def build_ivf(matrix, n_lists, iterations=10, sample_size=100000, seed=0):
+    """
+    Spherical k-means coarse quantizer. Trained on a sample, then every row
+    is assigned to its nearest centroid. Returns (centroids, assignments).
+    """
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(matrix))
+    sample = matrix[rng.choice(len(matrix), size=min(sample_size, len(matrix)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = sample[labels == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return centroids.astype(np.float32), assignments
+
+
+def copy_store(source, target, page_size=1000):
+    """Copy every record (with embeddings) from one store into another, e.g. Chroma -> NumPy."""
+    offset = 0
+    while True:
+        page = source.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        target.upsert(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    target.flush()
+    return offset
+
+
+if __name__ == "__main__":
+    import sys
+    from code.models import get_collection, get_vector_store, VECTOR_BACKEND, VECTOR_SHARDS
+
+    if "--shard" in sys.argv[1:]:
+        # Split the existing unsharded index into VECTOR_SHARDS shards of the same backend:
+        #   VECTOR_SHARDS=4 python -m code.vector_store --shard
+        if VECTOR_SHARDS <= 1:
+            sys.exit("Set VECTOR_SHARDS > 1 first.")
+        source = NumpyStore() if VECTOR_BACKEND == "numpy" else ChromaStore(get_collection())
+        n = copy_store(source, get_vector_store())
+        print(f"Copied {n} chunks into {VECTOR_SHARDS} {VECTOR_BACKEND} shards")
+    else:
+        # Build the NumPy store from the existing Chroma collection:
+        #   python -m code.vector_store
+        n = copy_store(ChromaStore(get_collection()), NumpyStore())
+        print(f"Copied {n} chunks from Chroma into {NUMPY_STORE_PATH}/")